@@ -4,14 +4,54 @@ Topic Checker Agent using Google ADK
 
 import os
 import sys
+import threading
+import time
 from google.adk.agents import LlmAgent
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, Optional
 from convex import ConvexClient
 
 # =============================================================================
 # TOOL AND HELPER FUNCTIONS
 # =============================================================================
+_convex_clients: Dict[str, ConvexClient] = {}
+_convex_clients_lock = threading.Lock()
+
+def _get_convex_client(convex_url: str) -> ConvexClient:
+    """
+    Return a shared Convex client for the given deployment URL.
+
+    ConvexClient keeps a single WebSocket open for its lifetime, so reusing one
+    client per URL avoids reconnecting on every tool call.
+    """
+    client = _convex_clients.get(convex_url)
+    if client is None:
+        with _convex_clients_lock:
+            client = _convex_clients.get(convex_url)
+            if client is None:
+                client = ConvexClient(convex_url)
+                _convex_clients[convex_url] = client
+    return client
+
+# Notification types are effectively static, so they are cached per process by key
+_NOTIFICATION_TYPES_TTL_SECONDS = 600
+_notification_types_cache: Dict[str, Any] = {"fetched_at": 0.0, "by_key": None}
+_notification_types_cache_lock = threading.Lock()
+
+def _get_notification_types_by_key(client: ConvexClient) -> Dict[str, Any]:
+    """Return notification types keyed by their `key`, refreshing from Convex once the TTL has expired"""
+    cache = _notification_types_cache
+    if cache["by_key"] is not None and time.monotonic() - cache["fetched_at"] < _NOTIFICATION_TYPES_TTL_SECONDS:
+        return cache["by_key"]
+    with _notification_types_cache_lock:
+        if cache["by_key"] is None or time.monotonic() - cache["fetched_at"] >= _NOTIFICATION_TYPES_TTL_SECONDS:
+            notification_types = client.query("notifications:getNotificationTypes")
+            cache.update(
+                by_key={nt.get("key"): nt for nt in notification_types},
+                fetched_at=time.monotonic()
+            )
+    return cache["by_key"]
+
 def create_bad_topic_notification(user_id: str, message: str):
     """
     Create a bad topic notification in the Convex database
@@ -29,18 +69,11 @@ def create_bad_topic_notification(user_id: str, message: str):
         if not convex_url:
             return {"success": False, "error": "CONVEX_URL environment variable not set"}
         
-        # Initialize Convex client
-        client = ConvexClient(convex_url)
+        # Get the shared Convex client
+        client = _get_convex_client(convex_url)
 
-        # Get notification types from the database
-        notification_types = client.query("notifications:getNotificationTypes")
-        
-        # Find the bad_topic notification type
-        bad_topic_type = None
-        for nt in notification_types:
-            if nt.get("key") == "bad_topic":
-                bad_topic_type = nt
-                break
+        # Find the bad_topic notification type (served from the TTL cache when fresh)
+        bad_topic_type = _get_notification_types_by_key(client).get("bad_topic")
         
         if not bad_topic_type:
             return {"success": False, "error": "bad_topic notification type not found in database"}
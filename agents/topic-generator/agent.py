@@ -2,27 +2,73 @@
 Simple Multi-Agent Topic Generator Agent using Google ADK
 """
 
+import asyncio
 import os
 import requests
 import json
 import re
 import sys
+import threading
 import time
-from google.adk.agents import LlmAgent, SequentialAgent
-from google.adk.tools import google_search
+import hashlib
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from google.adk.agents import BaseAgent, LlmAgent, ParallelAgent, SequentialAgent
+from google.adk.events import Event, EventActions
+from google.adk.models import Gemini, LlmRequest, LlmResponse
+from google.adk.tools import ToolContext, google_search
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, AsyncGenerator, Callable, Iterator, Optional, Tuple, Union, get_args, get_origin
+from typing_extensions import NotRequired, TypedDict
 from exa_py import Exa
-from convex import ConvexClient
 from google import genai
 from google.genai import types
 
+if TYPE_CHECKING:
+    # convex is imported lazily on first use to keep module import cheap
+    from convex import ConvexClient
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.agents.invocation_context import InvocationContext
+    from google.adk.agents.readonly_context import ReadonlyContext
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    # msgspec is optional; agent outputs are then parsed without type checks
+    msgspec = None
+
 exa = Exa(api_key = os.environ.get("EXA_API_KEY"))
 
+# Search tools are async so ADK awaits them and parallel agents keep running while
+# a search is in flight; the blocking SDK/HTTP calls run on worker threads, capped
+# per provider to stay within rate limits
+_SEARCH_CONCURRENCY = 16
+_exa_semaphore = asyncio.Semaphore(_SEARCH_CONCURRENCY)
+_serper_semaphore = asyncio.Semaphore(_SEARCH_CONCURRENCY)
+
+# Keep-alive session so repeat Serper calls reuse the TLS connection; the pool is
+# sized so every concurrent call can hold a connection
+_serper_session = requests.Session()
+_serper_session.headers.update({'Content-Type': 'application/json'})
+_serper_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=_SEARCH_CONCURRENCY))
+
 # =============================================================================
 # TOOL AND HELPER FUNCTIONS
 # =============================================================================
-def exa_search(query: str, result_category: str) -> dict:
+# Exa results already fetched in the current run, keyed by invocation, normalized
+# query and category, so agents searching the same thing share one API call
+_EXA_CACHE_MAXSIZE = 256
+_exa_search_cache: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+_exa_search_cache_lock = threading.Lock()
+
+async def exa_search(query: str, result_category: str, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Args:
         query: Search query
@@ -31,23 +77,41 @@ def exa_search(query: str, result_category: str) -> dict:
     Returns:
         dict: Search results with text and source URLs
     """
+    cache_key = None
+    if tool_context is not None:
+        cache_key = (tool_context.invocation_id, " ".join(query.lower().split()), result_category)
+        with _exa_search_cache_lock:
+            cached = _exa_search_cache.get(cache_key)
+        if cached is not None:
+            return cached
     try:
-        result = exa.search_and_contents(
-            query,
-            type = "auto",
-            num_results = int(os.environ.get("EXA_NUM_RESULTS", 5)),
-            text = {
-                "max_characters": 2048
-            },
-            **({"category": "news"} if result_category == "news" else {}),
-        )
+        async with _exa_semaphore:
+            result = await asyncio.to_thread(
+                exa.search_and_contents,
+                query,
+                type = "auto",
+                num_results = int(os.environ.get("EXA_NUM_RESULTS", 5)),
+                text = {
+                    "max_characters": 2048
+                },
+                **({"category": "news"} if result_category == "news" else {}),
+            )
+        
+        if cache_key is not None:
+            with _exa_search_cache_lock:
+                _exa_search_cache[cache_key] = result
+                if len(_exa_search_cache) > _EXA_CACHE_MAXSIZE:
+                    _exa_search_cache.popitem(last=False)
     
         return result
     except Exception as e:
         print(f"Error in exa_search: {e}")
         return {}
 
-def serper_image_search(query: str) -> dict:
+_MIN_THUMBNAIL_SIZE = 512
+_THUMBNAIL_IMAGE_FIELDS = ("title", "imageUrl", "imageWidth", "imageHeight", "source", "domain")
+
+async def serper_image_search(query: str) -> dict:
     """    
     Args:
         query: Image search query
@@ -59,45 +123,274 @@ def serper_image_search(query: str) -> dict:
     try:
         url = "https://google.serper.dev/images"
 
-        payload = json.dumps({
+        payload = _json_dumps({
             "q": query
         })
 
         headers = {
-            'X-API-KEY': os.environ.get("SERPER_API_KEY"),
-            'Content-Type': 'application/json'
+            'X-API-KEY': os.environ.get("SERPER_API_KEY")
         }
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        async with _serper_semaphore:
+            response = await asyncio.to_thread(
+                _serper_session.post, url, headers=headers, data=payload, timeout=10
+            )
+        result = _json_loads(response.content)
+
+        # Drop images the agent would reject anyway (too small or SVG) and keep only
+        # the fields it needs, so they don't cost model input tokens
+        images = []
+        for image in result.get("images", []):
+            image_url = image.get("imageUrl") or ""
+            if (
+                (image.get("imageWidth") or 0) >= _MIN_THUMBNAIL_SIZE
+                and (image.get("imageHeight") or 0) >= _MIN_THUMBNAIL_SIZE
+                and not image_url.lower().endswith(".svg")
+            ):
+                images.append({key: image[key] for key in _THUMBNAIL_IMAGE_FIELDS if key in image})
+        result["images"] = images
 
-        return response.json()
+        return result
     except Exception as e:
         print(f"Error in serper_image_search: {e}")
         return {}
 
+_EMBED_MODEL = "gemini-embedding-001"
+_EMBED_DIM = 768
+
+# Shared fallback vector; callers only serialize it, never mutate it
+_ZERO_EMBEDDING: List[float] = [0.0] * _EMBED_DIM
+_EMBED_CFG = types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY", output_dimensionality=_EMBED_DIM)
+_genai_client_instance = None
+
+# Recently generated embeddings keyed by model, dimension and content hash
+_EMBED_CACHE_MAXSIZE = 1024
+_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+def _genai_client() -> genai.Client:
+    """Return a shared Gemini client, creating it on first use"""
+    global _genai_client_instance
+    if _genai_client_instance is None:
+        _genai_client_instance = genai.Client()
+    return _genai_client_instance
+
+# Transient embedding failures are retried with exponential backoff before falling back to zeros
+_EMBED_MAX_ATTEMPTS = 3
+_EMBED_RETRY_BASE_SECONDS = 0.5
+
+def _embed_with_retry(client: genai.Client, contents: List[str]) -> Any:
+    """Call embed_content, retrying failed attempts so one transient error doesn't store a zero vector"""
+    for attempt in range(_EMBED_MAX_ATTEMPTS):
+        try:
+            return client.models.embed_content(model=_EMBED_MODEL, contents=contents, config=_EMBED_CFG)
+        except Exception as e:
+            if attempt == _EMBED_MAX_ATTEMPTS - 1:
+                raise
+            delay = _EMBED_RETRY_BASE_SECONDS * (2 ** attempt)
+            print(f"Warning: Embedding attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def _embedding_cache_key(text: str) -> str:
+    """Build the embedding cache key; model and dimension are included so a swap never reuses stale vectors"""
+    digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    return f"{_EMBED_MODEL}:{_EMBED_DIM}:{digest}"
+
+def generate_embeddings_batch(texts: List[str], batch_size: int = 64) -> List[List[float]]:
+    """
+    Generate embeddings for several texts in as few API round-trips as possible.
+    Texts embedded recently are served from an in-process cache.
+
+    Args:
+        texts: The texts to embed
+        batch_size: Maximum texts per request (the Gemini API accepts at most 100)
+
+    Returns:
+        List[List[float]]: One embedding vector (768 dimensions) per input text, in order
+    """
+    if not texts:
+        return []
+    keys = [_embedding_cache_key(text) for text in texts]
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    with _embedding_cache_lock:
+        for i, key in enumerate(keys):
+            cached = _embedding_cache.get(key)
+            if cached is not None:
+                _embedding_cache.move_to_end(key)
+                embeddings[i] = cached
+    # Blank texts get the zero vector so they can't make the API reject the whole batch
+    missing = []
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            if texts[i] and not texts[i].isspace():
+                missing.append(i)
+            else:
+                embeddings[i] = _ZERO_EMBEDDING
+    if not missing:
+        return embeddings
+    try:
+        client = _genai_client()
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            result = _embed_with_retry(client, [texts[i] for i in chunk])
+            with _embedding_cache_lock:
+                for i, embedding in zip(chunk, result.embeddings):
+                    embeddings[i] = embedding.values
+                    _embedding_cache[keys[i]] = embedding.values
+                    if len(_embedding_cache) > _EMBED_CACHE_MAXSIZE:
+                        _embedding_cache.popitem(last=False)
+        return embeddings
+
+    except Exception as e:
+        print(f"Error generating embeddings: {e}")
+        # Fall back to the shared zero vector for anything not cached; fallbacks are never cached
+        return [embedding if embedding is not None else _ZERO_EMBEDDING for embedding in embeddings]
+
+class _EmbeddingBatcher:
+    """
+    Coalesce concurrent single-text embedding requests into batched Gemini calls.
+
+    A background thread takes the first waiting request and embeds it with one
+    generate_embeddings_batch call. If other requests are already queued behind
+    it, it first keeps collecting for up to `window_seconds` (or until
+    `max_batch_size` texts are queued), so a lone request never waits out the
+    window. Requests that arrive while a call is in flight go into the next batch.
+    """
+
+    def __init__(self, window_seconds: float = 0.05, max_batch_size: int = 32):
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._window_seconds = window_seconds
+        self._max_batch_size = max_batch_size
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, text: str) -> "Future[List[float]]":
+        """Queue a text for embedding and return a future for its vector"""
+        future: "Future[List[float]]" = Future()
+        self._queue.put((text, future))
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            # Only wait for more texts when others are already queued; a lone text goes straight out
+            deadline = time.monotonic() + self._window_seconds
+            while len(pending) < self._max_batch_size and len(pending) + self._queue.qsize() > 1:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                embeddings = generate_embeddings_batch([text for text, _ in pending])
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(pending, embeddings):
+                future.set_result(embedding)
+
+
+_EMBED_TIMEOUT_SECONDS = 60
+_embedding_batcher = _EmbeddingBatcher()
+
 def generate_embedding(text: str) -> List[float]:
     """
     Generate an embedding for the given text.
-    
+    Concurrent calls are batched into a single Gemini request.
+
     Args:
         text: The text to embed
-        
+
     Returns:
         List[float]: The embedding vector (768 dimensions)
     """
+    # Blank text has nothing to embed (and the API rejects it)
+    if not text or text.isspace():
+        return _ZERO_EMBEDDING
     try:
-        client = genai.Client()
-        result = client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=text,
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY", output_dimensionality=768)
-        )
-        return result.embeddings[0].values
-        
+        return _embedding_batcher.submit(text).result(timeout=_EMBED_TIMEOUT_SECONDS)
     except Exception as e:
         print(f"Error generating embedding: {e}")
-        # Return a zero vector as fallback
-        return [0.0] * 768
+        return _ZERO_EMBEDDING
+
+
+_convex_clients: Dict[str, "ConvexClient"] = {}
+_convex_clients_lock = threading.Lock()
+
+def _get_convex_client(convex_url: str) -> "ConvexClient":
+    """
+    Return a shared Convex client for the given deployment URL.
+
+    ConvexClient keeps a single WebSocket open for its lifetime, so reusing one
+    client per URL lets every query and mutation share that connection instead
+    of reconnecting on each tool call.
+    """
+    client = _convex_clients.get(convex_url)
+    if client is None:
+        with _convex_clients_lock:
+            client = _convex_clients.get(convex_url)
+            if client is None:
+                from convex import ConvexClient
+                client = ConvexClient(convex_url)
+                _convex_clients[convex_url] = client
+    return client
+
+
+def _json_loads(data):
+    """Parse JSON from a str or bytes, using orjson when available"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    """Serialize an object to a JSON string, using orjson when available"""
+    return orjson.dumps(obj).decode() if orjson else json.dumps(obj)
+
+
+def _dig(data: Any, *keys: str, default: Any = None) -> Any:
+    """Look up a nested dict path, returning `default` on the first missing or non-dict level without allocating placeholders"""
+    for key in keys:
+        if not isinstance(data, dict):
+            return default
+        data = data.get(key)
+        if data is None:
+            return default
+    return data
+
+
+# Categories change rarely, so they are cached per process for a few minutes
+_CATEGORIES_TTL_SECONDS = 300
+_categories_cache: Dict[str, Any] = {"fetched_at": 0.0, "categories": None}
+_categories_cache_lock = threading.Lock()
+
+
+def _get_cached_categories(convex_url: str) -> List[Dict[str, Any]]:
+    """
+    Return the cached categories, refreshing them from Convex once the TTL has expired.
+    
+    Args:
+        convex_url: The Convex deployment URL
+        
+    Returns:
+        list: All categories
+    """
+    cache = _categories_cache
+    if cache["categories"] is not None and time.monotonic() - cache["fetched_at"] < _CATEGORIES_TTL_SECONDS:
+        return cache["categories"]
+    with _categories_cache_lock:
+        if cache["categories"] is None or time.monotonic() - cache["fetched_at"] >= _CATEGORIES_TTL_SECONDS:
+            cache.update(
+                categories=_get_convex_client(convex_url).query("categories:getCategories", {}),
+                fetched_at=time.monotonic()
+            )
+    return cache["categories"]
 
 
 def get_categories_from_convex() -> dict:
@@ -113,11 +406,8 @@ def get_categories_from_convex() -> dict:
         if not convex_url:
             return {"success": False, "error": "CONVEX_URL environment variable not set"}
         
-        # Initialize Convex client
-        client = ConvexClient(convex_url)
-        
-        # Get all categories
-        categories = client.query("categories:getCategories", {})
+        # Get all categories (served from the TTL cache when fresh)
+        categories = _get_cached_categories(convex_url)
         
         return {
             "success": True,
@@ -130,59 +420,48 @@ def get_categories_from_convex() -> dict:
             "error": f"Error fetching categories: {str(e)}"
         }
 
+class _SlugTable(dict):
+    """str.translate table for slugs: keeps [a-z0-9-], turns whitespace into '-', drops everything else"""
+
+    def __missing__(self, codepoint: int) -> Optional[str]:
+        char = chr(codepoint)
+        return self.setdefault(codepoint, "-" if char.isspace() else None)
+
+
+_SLUG_TABLE = _SlugTable({ord(c): c for c in "abcdefghijklmnopqrstuvwxyz0123456789-"})
+_DASH_RUN_RE = re.compile(r'-{2,}')
+
+
 def create_slug(title: str) -> str:
     """Create a URL-friendly slug from a title"""
-    slug = title.lower().strip()
-    slug = re.sub(r'[^a-z0-9\s-]', '', slug)
-    slug = re.sub(r'\s+', '-', slug)
-    slug = re.sub(r'-+', '-', slug)
-    return slug.strip('-')
+    slug = title.lower().translate(_SLUG_TABLE)
+    return _DASH_RUN_RE.sub('-', slug).strip('-')
 
 
-def estimate_read_time(text: str) -> int:
-    """Estimate reading time in minutes based on word count"""
-    words = len(text.split())
-    return max(1, round(words / 225))
+def truncate_text(text: str, limit: int) -> str:
+    """Truncate text to `limit` characters, adding an ellipsis if anything was cut"""
+    return text[:limit] + "..." if len(text) > limit else text
 
 
-def validate_category_id(category_id: str) -> Optional[str]:
+def count_words(text: str) -> int:
     """
-    Validate that the category ID exists, return it if valid, otherwise return 'Other' category ID
-    
-    Args:
-        category_id: The category ID to validate
-        
-    Returns:
-        str: Valid category ID or None if validation fails
+    Count whitespace-separated words without materializing them as str objects.
+    ASCII text (the common case for agent output) is split as bytes, which is
+    noticeably faster than Unicode-aware str.split on multi-KB inputs.
     """
-    if not category_id:
-        return None
-    try:
-        # Get Convex URL from environment
-        convex_url = os.environ.get("CONVEX_URL")
-        if not convex_url:
-            return None
-        
-        # Initialize Convex client
-        client = ConvexClient(convex_url)
-        
-        # Get all categories to validate the ID exists
-        all_categories = client.query("categories:getCategories", {})
-        
-        # Check if the provided category_id exists
-        for category in all_categories:
-            if category["_id"] == category_id:
-                return category_id
-        
-        # If not found, try to find "Other" category
-        for category in all_categories:
-            if category["name"].lower() == "other":
-                return category["_id"]
-        
-        return None
-    except Exception as e:
-        print(f"Error validating category: {e}")
-        return None
+    if text.isascii():
+        return len(text.encode("ascii").split())
+    return len(text.split())
+
+
+def read_time_from_word_count(words: int) -> int:
+    """Estimate reading time in minutes from an already computed word count"""
+    return max(1, round(words / 225))
+
+
+def estimate_read_time(text: str) -> int:
+    """Estimate reading time in minutes based on word count"""
+    return read_time_from_word_count(count_words(text))
 
 
 def process_tags(tag_names: List[str]) -> List[str]:
@@ -197,8 +476,175 @@ def process_tags(tag_names: List[str]) -> List[str]:
     """
     return [tag.strip() for tag in tag_names if tag and tag.strip()]
 
- 
-def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
+
+# Notification types are effectively static, so they are cached per process by key
+_NOTIFICATION_TYPES_TTL_SECONDS = 600
+_notification_types_cache: Dict[str, Any] = {"fetched_at": 0.0, "by_key": None}
+_notification_types_cache_lock = threading.Lock()
+
+
+def _get_notification_types_by_key(client: "ConvexClient") -> Dict[str, Any]:
+    """Return notification types keyed by their `key`, refreshing from Convex once the TTL has expired"""
+    cache = _notification_types_cache
+    if cache["by_key"] is not None and time.monotonic() - cache["fetched_at"] < _NOTIFICATION_TYPES_TTL_SECONDS:
+        return cache["by_key"]
+    with _notification_types_cache_lock:
+        if cache["by_key"] is None or time.monotonic() - cache["fetched_at"] >= _NOTIFICATION_TYPES_TTL_SECONDS:
+            notification_types = client.query("notifications:getNotificationTypes")
+            cache.update(
+                by_key={nt.get("key"): nt for nt in notification_types},
+                fetched_at=time.monotonic()
+            )
+    return cache["by_key"]
+
+
+def _send_error_notification(client: "ConvexClient", created_by: Optional[str], topic_title: str, error: str) -> None:
+    """Create the topic generation error notification, logging instead of raising on failure"""
+    try:
+        # Get the notification type for errors
+        error_notification_type = _get_notification_types_by_key(client).get("error")
+        
+        # Create error notification if notification type exists
+        if error_notification_type and created_by:
+            error_notification_data = {
+                "userId": created_by,
+                "notificationTypeKey": error_notification_type["_id"],
+                # "title": "Topic Generation Failed",
+                # "message": f"An error occurred while generating information for the topic '{topic_title}'. The system will retry up to 3 times automatically.",
+                "title": "Topic Generation retry In Progress",
+                "message": f"We are retrying to generate information for '{topic_title}' due to a minor issue.",
+                "data": {
+                    "error": error,
+                    "topic_title": topic_title
+                }
+            }
+            
+            try:
+                notification_id = client.mutation("notifications:createNotification", error_notification_data)
+                print(f"Successfully created error notification with ID: {notification_id}")
+            except Exception as notification_error:
+                print(f"Warning: Failed to create error notification: {str(notification_error)}")
+        else:
+            print("Warning: error notification type not found in database")
+    except Exception as notification_error:
+        print(f"Warning: Failed to create error notification: {str(notification_error)}")
+
+def _iter_blocks(
+    research_brief: Dict[str, Any],
+    quiz_questions: Optional[List[Dict[str, Any]]],
+    research_deep: Dict[str, Any],
+    reorder: Dict[str, Any],
+    real_world_impact: Dict[str, Any],
+    final_quiz_questions: Optional[List[Dict[str, Any]]],
+    flash_cards: List[Dict[str, Any]]
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield block payloads in display order - agent outputs directly matching schema.
+    Payloads reference the agent's text rather than copying it.
+    """
+    brief_text = research_brief.get("text")
+    deep_text = research_deep.get("text")
+    impact_content = real_world_impact.get("content")
+    
+    # 1. Brief Research Block (information type)
+    if brief_text:
+        yield {
+            "type": "information",
+            "content": {
+                "step": "research_brief",
+                "data": {
+                    "title": research_brief.get("title", ""),
+                    "text": brief_text,
+                    "depth": "brief"
+                }
+            }
+        }
+    
+    # 2. Quiz Block (activity type)
+    if quiz_questions:
+        yield {
+            "type": "activity",
+            "content": {
+                "step": "quiz",
+                "data": {
+                    "questions": quiz_questions
+                }
+            }
+        }
+    
+    # 3. Deep Research Block (information type)
+    if deep_text:
+        yield {
+            "type": "information",
+            "content": {
+                "step": "research_deep",
+                "data": {
+                    "title": research_deep.get("title", ""),
+                    "text": deep_text,
+                    "depth": "deep"
+                }
+            }
+        }
+    
+    # 4. Reorder Block (activity type)
+    if reorder.get("question"):
+        yield {
+            "type": "activity",
+            "content": {
+                "step": "reorder",
+                "data": {
+                    "question": reorder["question"],
+                    "options": reorder["options"],
+                    "correct_answer": reorder["correct_answer"],
+                    "explanation": reorder["explanation"]
+                }
+            }
+        }
+    
+    # 5. Real-World Impact Block (information type)
+    if impact_content:
+        yield {
+            "type": "information",
+            "content": {
+                "step": "real_world_impact",
+                "data": {
+                    "title": real_world_impact.get("title", ""),
+                    "content": impact_content,
+                    "source_urls": real_world_impact.get("source_urls", [])
+                }
+            }
+        }
+    
+    # 6. Final Quiz Block (activity type)
+    if final_quiz_questions:
+        yield {
+            "type": "activity",
+            "content": {
+                "step": "final_quiz",
+                "data": {
+                    "questions": final_quiz_questions
+                }
+            }
+        }
+    
+    # 7. Summary Flash Cards Block (information type)
+    if flash_cards:
+        yield {
+            "type": "information",
+            "content": {
+                "step": "summary",
+                "data": {
+                    "flash_cards": flash_cards
+                }
+            }
+        }
+
+
+# Runs the Gemini embedding alongside the Convex round trips of an insert; shared so an early return never waits on work still in flight
+_insert_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="topic-insert")
+
+
+async def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
     """
     Insert topic data from agent output into Convex database
     
@@ -209,25 +655,29 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
         
     Returns:
         dict: Result with topic_id if successful, error message if failed
-    """    
+    """
+    # The Convex client is synchronous, so the insert runs on a worker thread to keep
+    # the event loop free while it waits on the network
+    return await asyncio.to_thread(_insert_topic_to_convex_sync, agent_output, user_id, topic)
+
+
+def _insert_topic_to_convex_sync(agent_output: str, user_id: str, topic: str) -> dict:
+    """Blocking implementation of insert_topic_to_convex"""
     # Get Convex URL from environment
     convex_url = os.environ.get("CONVEX_URL")
     if not convex_url:
         return {"success": False, "error": "CONVEX_URL environment variable not set"}
     
-    # Initialize Convex client
-    client = ConvexClient(convex_url)
+    # Get the shared Convex client
+    client = _get_convex_client(convex_url)
     
     # Set default values for error handling
     topic_title = topic
     created_by = user_id
     
     try:
-        # Parse the agent output JSON
-        if isinstance(agent_output, str):
-            output_data = json.loads(agent_output)
-        else:
-            output_data = agent_output
+        # Parse the agent output JSON (the tool contract always passes a JSON string)
+        output_data = _json_loads(agent_output)
         
         # Extract data from agent output early for error handling
         topic_title = output_data.get("topic", topic_title)
@@ -240,55 +690,81 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
         real_world_impact = output_data.get("real_world_impact", {})
         
         # Handle category, description and tags from agent output
-        category_tags_description = output_data.get("category_tags_description", {})
-        selected_category_id = category_tags_description.get("selected_category")
-        short_description = category_tags_description.get("short_description", "")
-        generated_tags = category_tags_description.get("generated_tags", [])
+        selected_category_id = _dig(output_data, "category_tags_description", "selected_category")
+        short_description = _dig(output_data, "category_tags_description", "short_description", default="")
+        generated_tags = _dig(output_data, "category_tags_description", "generated_tags", default=[])
         
         # Get thumbnail data
-        thumbnail = output_data.get("thumbnail", {})
+        thumbnail_url = _dig(output_data, "thumbnail", "thumbnail_url")
+        source_urls = real_world_impact.get("source_urls")
+        
+        brief_text = research_brief.get("text", "")
+        deep_text = research_deep.get("text", "")
+        impact_content = real_world_impact.get("content", "")
+        
+        # Fail fast before touching Convex or Gemini if there is nothing to insert
+        if not (brief_text or deep_text or impact_content):
+            return {
+                "success": False,
+                "topic_id": None,
+                "message": "Error inserting topic: agent output contained no content blocks",
+                "metadata": None
+            }
+        
+        # The embedding doesn't depend on the block building below, so it starts now.
+        # Outputs without brief research embed whichever text they do have
+        embedding_future = _insert_executor.submit(generate_embedding, brief_text or deep_text or impact_content)
+        
+        # A retry of the same generation request must not create a duplicate topic, but
+        # a new request for the same title may; createTopicProgram checks the hash
+        request_id = output_data.get("request_id")
+        dedupe_hash = (
+            hashlib.sha256(f"{request_id}|{topic_title}|{difficulty}|{created_by}".encode()).hexdigest()
+            if request_id else None
+        )
         
         # Use short description from agent or fallback to brief research
-        description = short_description if short_description else (research_brief.get("text", "")[:500] + "..." if len(research_brief.get("text", "")) > 500 else research_brief.get("text", ""))
+        description = short_description or truncate_text(brief_text, 500)
         
-        # Calculate metadata
-        combined_text = (research_brief.get("text", "") + " " + 
-                       research_deep.get("text", "") + " " + 
-                       real_world_impact.get("content", ""))
+        # Calculate metadata (summing per field avoids building a combined copy of all the text)
+        word_count = count_words(brief_text) + count_words(deep_text) + count_words(impact_content)
+        estimated_time = read_time_from_word_count(word_count)
         
-        word_count = len(combined_text.split())
-        estimated_time = estimate_read_time(combined_text)
+        quiz_questions = _dig(output_data, "quiz", "questions")
+        reorder = output_data.get("reorder") or {}
+        final_quiz_questions = _dig(output_data, "final_quiz", "questions")
+        flash_cards = output_data.get("flash_cards") or []
         
-        # Count exercises (only from the blocks we're inserting)
-        exercise_count = 0
-        if output_data.get("quiz", {}).get("questions"):
-            exercise_count += len(output_data["quiz"]["questions"])
-        if output_data.get("reorder"):
-            exercise_count += 1
-        if output_data.get("final_quiz", {}).get("questions"):
-            exercise_count += len(output_data["final_quiz"]["questions"])
+        # Build block payloads in display order
+        blocks_to_create = list(_iter_blocks(
+            research_brief, quiz_questions, research_deep, reorder, real_world_impact, final_quiz_questions, flash_cards
+        ))
         
-        # Count information blocks
-        info_block_count = 0
-        if research_brief.get("text"):
-            info_block_count += 1
-        if research_deep.get("text"):
-            info_block_count += 1
-        if real_world_impact.get("content"):
-            info_block_count += 1
-        if output_data.get("flash_cards"):
-            info_block_count += 1
+        # Note: Thumbnail and category data are stored in the topic record itself,
+        # not as separate blocks, to match the schema union constraints
         
-        # Validate and use agent-selected category ID
-        category_id = validate_category_id(selected_category_id) if selected_category_id else None
+        # Count exercises and information blocks from the blocks we're inserting
+        exercise_count = 0
+        info_block_count = 0
+        for block in blocks_to_create:
+            block_data = block["content"]["data"]
+            if block["type"] == "information":
+                info_block_count += 1
+            elif "questions" in block_data:
+                exercise_count += len(block_data["questions"])
+            else:
+                # Reorder activity counts as a single exercise
+                exercise_count += 1
         
         # Use agent-generated tags
         tags = process_tags(generated_tags) if generated_tags else []
         
         # Collect sources
         sources = []
-        if real_world_impact.get("source_urls"):
-            sources.extend(real_world_impact["source_urls"])
+        if source_urls:
+            sources.extend(source_urls)
+        
+        embedding_vector = embedding_future.result()
         
         # Create topic
         topic_data = {
@@ -298,9 +774,9 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
             "difficulty": difficulty,
             "estimatedReadTime": estimated_time,
             "isAIGenerated": True,
-            "generationPrompt": json.dumps({"topic": topic_title, "difficulty": difficulty}),
+            "generationPrompt": _json_dumps({"topic": topic_title, "difficulty": difficulty}),
             "sources": sources if sources else None,
-            "imageUrl": thumbnail.get("thumbnail_url") if thumbnail.get("thumbnail_url") else None,
+            "imageUrl": thumbnail_url if thumbnail_url else None,
             "metadata": {
                 "wordCount": word_count,
                 "readingLevel": difficulty,
@@ -310,209 +786,34 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
         }
         
         # Add optional fields
-        if category_id:
-            topic_data["categoryId"] = category_id
         if tags:
             topic_data["tagIds"] = tags  # Use tagIds to match schema
         if created_by:
             topic_data["createdBy"] = created_by
+        if dedupe_hash:
+            topic_data["dedupeHash"] = dedupe_hash
         
-        # Create topic in Convex
-        topic_id = client.mutation("topics:createTopic", topic_data)
-        created_resources = {"topic_id": topic_id, "embedding_id": None, "block_ids": []}
-        
-        try:
-            # Create embedding for semantic search
-            embedding_vector = generate_embedding(research_brief["text"])
-            embedding_id = client.mutation("embeddings:createEmbedding", {
-                "topicId": topic_id,
-                "embedding": embedding_vector,
-                "contentType": "research_brief",
-                "difficulty": difficulty,
-                "categoryId": category_id
-            })
-            created_resources["embedding_id"] = embedding_id
-            
-            # Create blocks - insert agent outputs directly matching schema
-            order = 0
-        
-            # 1. Brief Research Block (information type)
-            if research_brief.get("text"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "information",
-                    "content": {
-                        "step": "research_brief",
-                        "data": {
-                            "title": research_brief.get("title", ""),
-                            "text": research_brief["text"],
-                            "depth": "brief"
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
+        # Embedding for semantic search
+        embedding_data = {"contentType": "research_brief", "embedding": embedding_vector}
         
-            # 2. Quiz Block (activity type)
-            quiz = output_data.get("quiz", {})
-            if quiz.get("questions"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "activity",
-                    "content": {
-                        "step": "quiz",
-                        "data": {
-                            "questions": quiz["questions"]
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
-            # 3. Deep Research Block (information type)
-            if research_deep.get("text"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "information",
-                    "content": {
-                        "step": "research_deep",
-                        "data": {
-                            "title": research_deep.get("title", ""),
-                            "text": research_deep["text"],
-                            "depth": "deep"
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
-            # 4. Reorder Block (activity type)
-            reorder = output_data.get("reorder", {})
-            if reorder.get("question"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "activity",
-                    "content": {
-                        "step": "reorder",
-                        "data": {
-                            "question": reorder["question"],
-                            "options": reorder["options"],
-                            "correct_answer": reorder["correct_answer"],
-                            "explanation": reorder["explanation"]
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
-            # 5. Real-World Impact Block (information type)
-            if real_world_impact.get("content"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "information",
-                    "content": {
-                        "step": "real_world_impact",
-                        "data": {
-                            "title": real_world_impact.get("title", ""),
-                            "content": real_world_impact["content"],
-                            "source_urls": real_world_impact.get("source_urls", [])
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
-            # 6. Final Quiz Block (activity type)
-            final_quiz = output_data.get("final_quiz", {})
-            if final_quiz.get("questions"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "activity",
-                    "content": {
-                        "step": "final_quiz",
-                        "data": {
-                            "questions": final_quiz["questions"]
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
-            # 7. Summary Flash Cards Block (information type)
-            flash_cards = output_data.get("flash_cards", [])
-            if flash_cards:
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
-                    "type": "information",
-                    "content": {
-                        "step": "summary",
-                        "data": {
-                            "flash_cards": flash_cards
-                        }
-                    },
-                    "order": order
-                })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
-            # Note: Thumbnail and category data are stored in the topic record itself,
-            # not as separate blocks, to match the schema union constraints
-            
-            # Publish if requested
-            if publish_immediately:
-                client.mutation("topics:publishTopic", {"topicId": topic_id})
-        
-        except Exception as block_error:
-            # If any block creation fails, clean up all created resources
-            print(f"Error creating blocks, cleaning up resources: {str(block_error)}")
-            
-            # Delete all created blocks
-            for block_id in created_resources["block_ids"]:
-                try:
-                    client.mutation("blocks:deleteBlock", {"blockId": block_id})
-                except Exception as cleanup_error:
-                    print(f"Warning: Failed to delete block {block_id}: {str(cleanup_error)}")
-            
-            # Delete embedding if created
-            if created_resources["embedding_id"]:
-                try:
-                    client.mutation("embeddings:deleteEmbedding", {"embeddingId": created_resources["embedding_id"]})
-                except Exception as cleanup_error:
-                    print(f"Warning: Failed to delete embedding {created_resources['embedding_id']}: {str(cleanup_error)}")
-            
-            # Delete topic
-            try:
-                client.mutation("topics:deleteTopic", {"topicId": topic_id})
-            except Exception as cleanup_error:
-                print(f"Warning: Failed to delete topic {topic_id}: {str(cleanup_error)}")
-            
-            # Re-raise the original exception without creating notifications here
-            # The outer handler will create the error notification
-            raise block_error
+        program_args = {
+            "topic": topic_data,
+            "embedding": embedding_data,
+            "blocks": [{**block, "order": order} for order, block in enumerate(blocks_to_create)]
+        }
         
-        # Get the notification type for topic_generated
-        notification_types = client.query("notifications:getNotificationTypes")
-        topic_generated_type = None
-        for nt in notification_types:
-            if nt.get("key") == "topic_generated":
-                topic_generated_type = nt
-                break
+        # Convex checks the agent-selected category inside the same transaction
+        if selected_category_id:
+            program_args["selectedCategoryId"] = selected_category_id
         
-        # Create success notification if notification type exists
-        if topic_generated_type:
-            notification_data = {
+        # Success notification; Convex resolves the type by key and adds the topic ID
+        if created_by:
+            program_args["notification"] = {
                 "userId": created_by,
-                "notificationTypeKey": topic_generated_type["_id"],
+                "typeKey": "topic_generated",
                 "title": "Topic Generated Successfully",
                 "message": f"Your topic '{topic_title}' has been generated and is ready to explore!",
                 "data": {
-                    "topicId": topic_id,
                     "metadata": {
                         "topic_title": topic_title,
                         "difficulty": difficulty,
@@ -522,13 +823,26 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                     }
                 }
             }
-            
-            try:
-                notification_id = client.mutation("notifications:createNotification", notification_data)
-                print(f"Successfully created notification with ID: {notification_id}")
-            except Exception as e:
-                print(f"Warning: Failed to create success notification: {str(e)}")
-        else:
+        
+        # Topic, embedding, blocks and notification are written in one transaction,
+        # so a failure leaves nothing behind to clean up
+        result = client.mutation("topics:createTopicProgram", program_args)
+        topic_id = result["topicId"]
+        
+        if result["deduped"]:
+            # An earlier attempt of this request already saved the topic; Convex sent
+            # its notification if that attempt hadn't
+            return {
+                "success": True,
+                "topic_id": topic_id,
+                "message": f"Topic '{topic_title}' already exists with ID: {topic_id}",
+                "metadata": None,
+                "deduped": True
+            }
+        
+        if result["notificationId"]:
+            print(f"Successfully created notification with ID: {result['notificationId']}")
+        elif created_by:
             print("Warning: topic_generated notification type not found in database")
         
         return {
@@ -544,74 +858,14 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
             }
         }
     except Exception as e:
-        # If we have a topic_id in locals(), it means topic creation succeeded but something else failed
-        # We should clean up the topic and any associated resources
-        if 'topic_id' in locals():
-            print(f"Error during topic insertion, cleaning up topic {topic_id}: {str(e)}")
-            
-            try:
-                # Try to get all blocks for this topic and delete them
-                blocks = client.query("blocks:getBlocksByTopicId", {"topicId": topic_id})
-                for block in blocks:
-                    try:
-                        client.mutation("blocks:deleteBlock", {"blockId": block["_id"]})
-                    except Exception as cleanup_error:
-                        print(f"Warning: Failed to delete block {block['_id']}: {str(cleanup_error)}")
-                
-                # Try to delete any embeddings for this topic
-                try:
-                    embeddings = client.query("embeddings:getEmbeddingsByTopicId", {"topicId": topic_id})
-                    for embedding in embeddings:
-                        try:
-                            client.mutation("embeddings:deleteEmbedding", {"embeddingId": embedding["_id"]})
-                        except Exception as cleanup_error:
-                            print(f"Warning: Failed to delete embedding {embedding['_id']}: {str(cleanup_error)}")
-                except Exception as query_error:
-                    print(f"Warning: Could not query embeddings for cleanup: {str(query_error)}")
-                
-                # Finally delete the topic
-                client.mutation("topics:deleteTopic", {"topicId": topic_id})
-                print(f"Successfully cleaned up topic {topic_id} and associated resources")
-                
-            except Exception as cleanup_error:
-                print(f"Warning: Failed to clean up topic {topic_id}: {str(cleanup_error)}")
-        
-        # Create error notification
-        try:
-            # Get the notification type for errors
-            notification_types = client.query("notifications:getNotificationTypes")
-            error_notification_type = None
-            for nt in notification_types:
-                if nt.get("key") == "error":
-                    error_notification_type = nt
-                    break
-            
-            # Create error notification if notification type exists
-            if error_notification_type and created_by:
-                error_notification_data = {
-                    "userId": created_by,
-                    "notificationTypeKey": error_notification_type["_id"],
-                    # "title": "Topic Generation Failed",
-                    # "message": f"An error occurred while generating information for the topic '{topic_title}'. The system will retry up to 3 times automatically.",
-                    "title": "Topic Generation retry In Progress",
-                    "message": f"We are retrying to generate information for '{topic_title}' due to a minor issue.",
-                    "data": {
-                        "error": str(e),
-                        "topic_title": topic_title
-                    }
-                }
-                
-                try:
-                    notification_id = client.mutation("notifications:createNotification", error_notification_data)
-                    print(f"Successfully created error notification with ID: {notification_id}")
-                except Exception as notification_error:
-                    print(f"Warning: Failed to create error notification: {str(notification_error)}")
-            else:
-                print("Warning: error notification type not found in database")
-        except Exception as notification_error:
-            print(f"Warning: Failed to create error notification: {str(notification_error)}")
+        # Send the error notification in the background so the failure response isn't delayed
+        threading.Thread(
+            target=_send_error_notification,
+            args=(client, created_by, topic_title, str(e)),
+            daemon=True
+        ).start()
         
-        # Return failure response after creating notification
+        # Return failure response without waiting on the notification
         return {
             "success": False,
             "topic_id": None,
@@ -619,12 +873,423 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
             "metadata": None
         }
 
+# Sub-agent outputs are cached per (topic, difficulty, agent) so popular topics
+# skip the LLM and search round-trips. News-driven output goes stale faster.
+_AGENT_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+_NEWS_AGENT_CACHE_TTL_SECONDS = 24 * 60 * 60
+_AGENT_CACHE_MAXSIZE = 512
+_agent_output_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+_agent_output_cache_lock = threading.Lock()
+
+
+def _agent_cache_key(callback_context: "CallbackContext") -> Optional[str]:
+    """Build the cache key from the request's topic and difficulty, or None if the request can't be read"""
+    try:
+        request = _json_loads(callback_context.user_content.parts[0].text)
+        topic = " ".join(request["topic"].lower().split())
+        difficulty = request.get("difficulty", "beginner").lower()
+    except Exception:
+        return None
+    raw_key = f"{topic}|{difficulty}|{callback_context.agent_name}"
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+def _output_cache_callbacks(
+    output_key: str,
+    ttl_seconds: int,
+    before_model_callback: Optional[Callable[..., Any]] = None
+) -> Dict[str, Any]:
+    """
+    Build callbacks that cache an agent's output_key value.
+
+    On a hit, a before_model_callback answers with the cached value as the model's
+    response, so only the model call is skipped: the agent still finishes normally,
+    saves output_key and hands over to the next agent in the pipeline.
+
+    Args:
+        output_key: The state key the agent writes its output to
+        ttl_seconds: How long a cached output stays valid
+        before_model_callback: Another before_model_callback to run on cache misses
+
+    Returns:
+        dict: Keyword arguments for LlmAgent (before_model_callback, after_agent_callback)
+    """
+    def cached_response_callback(callback_context: "CallbackContext", llm_request: LlmRequest) -> Optional[LlmResponse]:
+        key = _agent_cache_key(callback_context)
+        if key is None:
+            return None
+        with _agent_output_cache_lock:
+            entry = _agent_output_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del _agent_output_cache[key]
+                return None
+            _agent_output_cache.move_to_end(key)
+            value = entry[1]
+        text = value if isinstance(value, str) else _json_dumps(value)
+        return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+    def after_agent_callback(callback_context: "CallbackContext") -> None:
+        value = callback_context.state.get(output_key)
+        key = _agent_cache_key(callback_context)
+        if not value or key is None:
+            return None
+        with _agent_output_cache_lock:
+            _agent_output_cache[key] = (time.monotonic() + ttl_seconds, value)
+            _agent_output_cache.move_to_end(key)
+            if len(_agent_output_cache) > _AGENT_CACHE_MAXSIZE:
+                _agent_output_cache.popitem(last=False)
+        return None
+
+    before_model_callbacks = [cached_response_callback]
+    if before_model_callback is not None:
+        before_model_callbacks.append(before_model_callback)
+    return {
+        "before_model_callback": before_model_callbacks,
+        "after_agent_callback": after_agent_callback
+    }
+
+# Agents keep their constructor model unless the request's difficulty lets a
+# smaller model do the job; (agent name -> difficulty -> model)
+_MODEL_OVERRIDES: Dict[str, Dict[str, str]] = {
+    "ResearchAgentBrief": {"beginner": "gemini-2.0-flash"},
+    "ResearchAgentDeep": {"beginner": "gemini-2.0-flash", "intermediate": "gemini-2.0-flash"},
+}
+
+
+def model_selector(difficulty: str, agent_name: str, default_model: str) -> str:
+    """
+    Pick the smallest model that is good enough for an agent at a given difficulty.
+
+    Args:
+        difficulty: The requested difficulty (beginner, intermediate or advanced)
+        agent_name: The agent's name
+        default_model: The model to use when no override applies
+
+    Returns:
+        str: The model name to call
+    """
+    return _MODEL_OVERRIDES.get(agent_name, {}).get(difficulty, default_model)
+
+
+def _select_model_callback(callback_context: "CallbackContext", llm_request: Any) -> None:
+    """before_model_callback that swaps the request's model according to model_selector"""
+    try:
+        request = _json_loads(callback_context.user_content.parts[0].text)
+        difficulty = request.get("difficulty", "beginner").lower()
+    except Exception:
+        return None
+    llm_request.model = model_selector(difficulty, callback_context.agent_name, llm_request.model)
+    return None
+
+
+# Hedged Gemini calls: if a call is still running after that model's recent p95
+# latency, an identical backup call is fired and whichever finishes first wins.
+# Backups are paid for from a token bucket that refills by 0.1 per call, which
+# keeps duplicate traffic at or below ~10%.
+_HEDGE_MIN_SAMPLES = 20
+_HEDGE_BUDGET_RATIO = 0.1
+_HEDGE_BUDGET_MAX = 10.0
+_llm_latencies: Dict[str, "deque[float]"] = {}
+_hedge_budget = {"tokens": 0.0}
+_hedge_lock = threading.Lock()
+
+
+def _hedge_delay(model: str) -> Optional[float]:
+    """Return the p95 latency (seconds) seen for a model, or None until enough calls were observed"""
+    with _hedge_lock:
+        samples = sorted(_llm_latencies.get(model, ()))
+    if len(samples) < _HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95)]
+
+
+def _record_llm_call(model: str, seconds: float) -> None:
+    """Record a call's latency and add its share to the hedging budget"""
+    with _hedge_lock:
+        _llm_latencies.setdefault(model, deque(maxlen=200)).append(seconds)
+        _hedge_budget["tokens"] = min(_HEDGE_BUDGET_MAX, _hedge_budget["tokens"] + _HEDGE_BUDGET_RATIO)
+
+
+def _take_hedge_token() -> bool:
+    """Spend one hedging token if available"""
+    with _hedge_lock:
+        if _hedge_budget["tokens"] < 1.0:
+            return False
+        _hedge_budget["tokens"] -= 1.0
+        return True
+
+
+class HedgedGemini(Gemini):
+    """Gemini model that hedges slow non-streaming calls with a backup request"""
+
+    async def _generate_once(self, llm_request: LlmRequest) -> List[LlmResponse]:
+        started = time.monotonic()
+        responses = [
+            response async for response in super().generate_content_async(llm_request, stream=False)
+        ]
+        _record_llm_call(llm_request.model, time.monotonic() - started)
+        return responses
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if stream:
+            async for response in super().generate_content_async(llm_request, stream=True):
+                yield response
+            return
+
+        # Unhedged calls go through _generate_once too, so they feed the latency
+        # samples and the hedging budget that later calls depend on
+        delay = _hedge_delay(llm_request.model)
+        if delay is None:
+            for response in await self._generate_once(llm_request):
+                yield response
+            return
+
+        tasks = {asyncio.create_task(self._generate_once(llm_request))}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and _take_hedge_token():
+            # The backup gets its own copy because Gemini appends to the request's contents.
+            # Those edits are idempotent, so copying after the primary started is safe
+            backup_request = llm_request.model_copy(deep=True)
+            tasks.add(asyncio.create_task(self._generate_once(backup_request)))
+
+        responses = None
+        error = None
+        try:
+            while tasks and responses is None:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        responses = task.result()
+                        break
+                    error = task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+        if responses is None:
+            raise error
+        for response in responses:
+            yield response
+
+
+# Agents without an output_schema store their reply as raw JSON text.
+def _state_output_data(state: Any, output_key: str) -> Dict[str, Any]:
+    """Return the "data" payload of a sub-agent output in state, or {} if it is missing or unparseable"""
+    value = state.get(output_key)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+        try:
+            value = _json_loads(text)
+        except ValueError:
+            print(f"Warning: Could not parse {output_key} as JSON")
+            return {}
+    data = _dig(value, "data")
+    return data if isinstance(data, dict) else {}
+
+
+# Rough Gemini token estimate for English prose; close enough to size prompt inputs
+_CHARS_PER_TOKEN = 4
+
+
+def trim_to_token_budget(text: str, max_tokens: int) -> str:
+    """
+    Trim text to roughly `max_tokens` tokens, ending on a sentence boundary when
+    one falls in the second half of the budget.
+
+    Args:
+        text: The text to trim
+        max_tokens: The token budget
+
+    Returns:
+        str: The text unchanged if it fits, otherwise the trimmed text with an ellipsis
+    """
+    limit = max_tokens * _CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "), cut.rfind("\n"))
+    if end >= limit // 2:
+        cut = cut[:end + 1]
+    return cut.rstrip() + " ..."
+
+
+_PLACEHOLDER_RE = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+def _compile_instruction(template: str, keys: Tuple[str, ...]) -> List[str]:
+    """
+    Split an instruction template once into alternating literal and placeholder segments.
+
+    Only `{key}` placeholders for the given keys are split out; every other brace
+    (such as the JSON schema examples) stays literal.
+
+    Args:
+        template: The instruction text
+        keys: The state keys to substitute
+
+    Returns:
+        list: [literal, key, literal, key, ..., literal] with interned keys
+    """
+    segments = []
+    last_end = 0
+    for match in _PLACEHOLDER_RE.finditer(template):
+        if match.group(1) not in keys:
+            continue
+        segments.append(template[last_end:match.start()])
+        segments.append(sys.intern(match.group(1)))
+        last_end = match.end()
+    segments.append(template[last_end:])
+    return segments
+
+
+def _render_instruction(segments: List[str], values: Callable[[str], str]) -> str:
+    """Join precompiled instruction segments, filling each placeholder with values(key)"""
+    parts = segments.copy()
+    for i in range(1, len(parts), 2):
+        parts[i] = values(parts[i])
+    return "".join(parts)
+
+
+def _state_instruction(template: str, *keys: str) -> Callable[["ReadonlyContext"], str]:
+    """
+    Build an instruction provider that fills `{key}` placeholders from session state.
+
+    Behaves like ADK's own state injection (str() of the value, KeyError when missing),
+    but the template is parsed once at import instead of on every model call.
+
+    Args:
+        template: The instruction text
+        *keys: The state keys referenced by the template
+
+    Returns:
+        Callable: An instruction provider for LlmAgent
+    """
+    segments = _compile_instruction(template, keys)
+
+    def instruction_provider(context: "ReadonlyContext") -> str:
+        state = context.state
+
+        def value(key: str) -> str:
+            if key not in state:
+                raise KeyError(f"Context variable not found: `{key}`.")
+            return str(state[key])
+
+        return _render_instruction(segments, value)
+
+    return instruction_provider
+
 # =============================================================================
 # OUTPUT SCHEMAS
 # =============================================================================
 
+_model_builders: Dict[type, Callable[[Any], Any]] = {}
+
+def _value_builder(annotation: Any) -> Optional[Callable[[Any], Any]]:
+    """Return a builder for a field's nested models, or None if the value is used as-is"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _model_builder(annotation)
+    if get_origin(annotation) is list:
+        item_builder = _value_builder((get_args(annotation) or (Any,))[0])
+        if item_builder is not None:
+            return lambda value: [item_builder(item) for item in value] if isinstance(value, list) else value
+    return None
+
+def _model_builder(model_cls: type) -> Callable[[Any], Any]:
+    """
+    Return (compiling once per schema) a function that model_constructs `model_cls`
+    from a dict. Field annotations are resolved up front into a flat plan, so
+    building a model is just key lookups and calls to the nested builders.
+    """
+    builder = _model_builders.get(model_cls)
+    if builder is None:
+        plan = [(sys.intern(name), _value_builder(field.annotation)) for name, field in model_cls.model_fields.items()]
+        field_names = frozenset(model_cls.model_fields)
+        construct = model_cls.model_construct
+        new = model_cls.__new__
+
+        def builder(data: Any) -> Any:
+            if not isinstance(data, dict):
+                return data
+            fields = {}
+            for name, build in plan:
+                if name in data:
+                    value = data[name]
+                    fields[name] = build(value) if build is not None else value
+            if len(fields) < len(field_names):
+                # Let model_construct fill in defaults for missing fields
+                return construct(**fields)
+            # Every field is present (the norm for the small repeated models such as
+            # Question and FlashCard), so set the instance state directly
+            instance = new(model_cls)
+            object.__setattr__(instance, "__dict__", fields)
+            object.__setattr__(instance, "__pydantic_fields_set__", set(field_names))
+            object.__setattr__(instance, "__pydantic_extra__", None)
+            object.__setattr__(instance, "__pydantic_private__", None)
+            return instance
+
+        _model_builders[model_cls] = builder
+    return builder
+
+_msgspec_typed_dicts: Dict[type, Any] = {}
+
+def _msgspec_type(annotation: Any) -> Any:
+    """Translate a pydantic field annotation into the equivalent msgspec type"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _msgspec_typed_dict(annotation)
+    origin = get_origin(annotation)
+    if origin is None:
+        return annotation
+    args = tuple(_msgspec_type(arg) for arg in get_args(annotation))
+    if origin is list:
+        return List[args[0]]
+    if origin is dict:
+        return Dict[args[0], args[1]]
+    if origin is Union:
+        return Union[args]
+    return annotation
+
+def _msgspec_typed_dict(model_cls: type) -> Any:
+    """
+    Return (building once) a TypedDict mirroring a pydantic model's fields. msgspec
+    type-checks the reply against it while decoding straight to plain dicts; fields
+    with defaults are NotRequired and left for model_construct to fill in.
+    """
+    typed_dict = _msgspec_typed_dicts.get(model_cls)
+    if typed_dict is None:
+        fields = {}
+        for name, field in model_cls.model_fields.items():
+            field_type = _msgspec_type(field.annotation)
+            fields[name] = field_type if field.is_required() else NotRequired[field_type]
+        typed_dict = TypedDict(model_cls.__name__, fields)
+        _msgspec_typed_dicts[model_cls] = typed_dict
+    return typed_dict
+
+class _TrustedJsonModel(BaseModel):
+    """
+    Base for agent output schemas. ADK passes the schema to Gemini as the response
+    schema, so the reply already conforms to it; parsing it builds the models with
+    model_construct instead of running a second full pydantic validation pass.
+    When msgspec is installed, the reply is type-checked during decoding against
+    a TypedDict mirror of the schema.
+    """
+
+    @classmethod
+    def model_validate_json(cls, json_data, **kwargs):
+        if msgspec is not None:
+            data = msgspec.json.decode(json_data, type=_msgspec_typed_dict(cls))
+        else:
+            data = _json_loads(json_data)
+            if not isinstance(data, dict):
+                return super().model_validate_json(json_data, **kwargs)
+        return _model_builder(cls)(data)
+
 # Base schema for all agent outputs
-class BaseAgentOutput(BaseModel):
+class BaseAgentOutput(_TrustedJsonModel):
     step: str = Field(description="The agent step identifier")
     type: str = Field(description="The content type")
     data: Dict[str, Any] = Field(description="The actual data payload")
@@ -659,7 +1324,9 @@ class FlashCard(BaseModel):
     front: str = Field(description="Question or key term")
     back: str = Field(description="Answer or definition")
 
-class SummaryData(BaseModel):
+class ActivitiesData(BaseModel):
+    quiz: QuizData = Field(description="Quiz activity with 3 foundational questions")
+    final_quiz: QuizData = Field(description="Final quiz with 5 comprehensive questions")
     flash_cards: List[FlashCard] = Field(description="List of 3-4 flash cards")
 
 class ThumbnailData(BaseModel):
@@ -677,30 +1344,20 @@ class ResearchAgentOutput(BaseAgentOutput):
     type: str = Field(default="information", description="Content type")
     data: ResearchData = Field(description="Research data")
 
-class QuizAgentOutput(BaseAgentOutput):
-    step: str = Field(default="quiz", description="Agent step")
-    type: str = Field(default="activity", description="Content type")
-    data: QuizData = Field(description="Quiz data")
-
 class ReorderAgentOutput(BaseAgentOutput):
     step: str = Field(default="reorder", description="Agent step")
     type: str = Field(default="activity", description="Content type")
     data: ReorderData = Field(description="Reorder data")
 
-class FinalQuizAgentOutput(BaseAgentOutput):
-    step: str = Field(default="final_quiz", description="Agent step")
-    type: str = Field(default="activity", description="Content type")
-    data: QuizData = Field(description="Final quiz data")
-
 class RealWorldImpactAgentOutput(BaseAgentOutput):
     step: str = Field(default="real_world_impact", description="Agent step")
     type: str = Field(default="information", description="Content type")
     data: RealWorldImpactData = Field(description="Real world impact data")
 
-class SummaryAgentOutput(BaseAgentOutput):
-    step: str = Field(default="summary", description="Agent step")
-    type: str = Field(default="information", description="Content type")
-    data: SummaryData = Field(description="Summary data")
+class ActivitiesAgentOutput(BaseAgentOutput):
+    step: str = Field(default="activities", description="Agent step")
+    type: str = Field(default="activity", description="Content type")
+    data: ActivitiesData = Field(description="Quiz, final quiz and flash card data")
 
 class ThumbnailAgentOutput(BaseAgentOutput):
     step: str = Field(default="thumbnail", description="Agent step")
@@ -712,11 +1369,12 @@ class CategoryTagsDescriptionAgentOutput(BaseAgentOutput):
     type: str = Field(default="metadata", description="Content type")
     data: CategoryTagsDescriptionData = Field(description="Category, tags and description data")
 
-class FinalAssemblyOutput(BaseModel):
+class FinalAssemblyOutput(_TrustedJsonModel):
     topic: str = Field(description="The educational topic name from user input")
     difficulty: str = Field(description="The difficulty level from user input")
     created_by: Optional[str] = Field(description="The user ID from user input (or null if not provided)")
     publish_immediately: bool = Field(description="The publish flag from user input (either True or False, default True)")
+    request_id: Optional[str] = Field(description="The generation request ID from user input (or null if not provided)")
     research_brief: ResearchData = Field(description="Brief research results")
     research_deep: ResearchData = Field(description="Deep research results")
     quiz: QuizData = Field(description="Quiz activity with 3 questions")
@@ -733,6 +1391,16 @@ class ConvexInsertionResult(BaseModel):
     message: str = Field(description="Success message or error description")
     metadata: Optional[Dict[str, Any]] = Field(description="Additional metadata about the insertion")
 
+# Build the parse plans (and msgspec mirrors) at import so the first request doesn't pay for them
+for _schema in (
+    ResearchAgentOutput, ReorderAgentOutput, RealWorldImpactAgentOutput,
+    ActivitiesAgentOutput, ThumbnailAgentOutput,
+    CategoryTagsDescriptionAgentOutput, FinalAssemblyOutput
+):
+    _model_builder(_schema)
+    if msgspec is not None:
+        _msgspec_typed_dict(_schema)
+
 # =============================================================================
 # AGENT DEFINITIONS
 # =============================================================================
@@ -740,7 +1408,7 @@ class ConvexInsertionResult(BaseModel):
 # 1. Research Agent Brief
 research_agent_brief = LlmAgent(
     name="ResearchAgentBrief",
-    model="gemini-2.5-flash",
+    model=HedgedGemini(model="gemini-2.5-flash"),
     instruction="""
         You are a diligent research assistant conducting BRIEF research. Your task is to use the Exa AI Search tool to find broad, comprehensive foundational information from reputable web sources.
 
@@ -806,75 +1474,14 @@ research_agent_brief = LlmAgent(
     """,
     # output_schema=ResearchAgentOutput,
     output_key="research_brief_output",
+    **_output_cache_callbacks("research_brief_output", _AGENT_CACHE_TTL_SECONDS, before_model_callback=_select_model_callback),
     tools=[exa_search]
 )
 
-# 2. Quiz Agent (3 questions, difficulty-adaptive)
-quiz_agent = LlmAgent(
-    name="QuizAgent", 
-    model="gemini-2.0-flash-lite",
-    instruction="""
-        You are an expert educational content designer creating QUIZ activities. Your goal is to create 3 quiz questions that test understanding of foundational concepts.
-
-        Use the research data from {research_brief_output} to create your questions. The user input contains a difficulty level - adapt your questions accordingly:
-
-        BEGINNER LEVEL QUESTIONS:
-        - Focus on basic definitions and simple concepts
-        - Use straightforward language
-        - Test recall and basic understanding
-        - Include obvious wrong answers to help learning
-
-        INTERMEDIATE LEVEL QUESTIONS:
-        - Test application of concepts
-        - Require some analysis and connection-making
-        - Include plausible distractors
-        - Mix factual and conceptual questions
-
-        ADVANCED LEVEL QUESTIONS:
-        - Test synthesis and evaluation
-        - Require deep understanding and critical thinking
-        - Include subtle distinctions between options
-        - Focus on complex relationships and implications
-
-        Create exactly 3 multiple-choice questions that:
-        - Match the specified difficulty level
-        - Test understanding of FOUNDATIONAL concepts from the brief research
-        - Have 4 answer options each
-        - Include clear explanations for why the correct answer is right
-
-        NOTE: These are the FIRST quiz questions in the learning module. Focus on foundational concepts that will be built upon later.
-
-        CRITICAL FORMATTING REQUIREMENTS:
-        - You must respond with ONLY a valid JSON object.
-        - DO NOT wrap the JSON in code fences (no ```json or ``` at all).
-        - DO NOT output any explanation, commentary, or extra text outside the JSON.
-        - Your entire response must start with "{" and end with "}".
-        - The JSON must exactly match the required schema.
-
-        Required JSON schema:
-        {
-            "step": "quiz",
-            "type": "activity",
-            "data": {
-                "questions": [
-                    {
-                        "question": "Your question text here",
-                        "options": ["Option A", "Option B", "Option C", "Option D"],
-                        "correct_answer": "Option A",
-                        "explanation": "Explanation why this is correct"
-                    }
-                ]
-            }
-        }
-    """,
-    output_schema=QuizAgentOutput,
-    output_key="quiz_output"
-)
-
-# 3. Research Agent Deep
+# 2. Research Agent Deep
 research_agent_deep = LlmAgent(
     name="ResearchAgentDeep",
-    model="gemini-2.5-flash",
+    model=HedgedGemini(model="gemini-2.5-flash"),
     instruction="""
         You are a specialized research assistant conducting ADVANCED, IN-DEPTH research. Your task is to go BEYOND basic concepts and provide specialized, technical information.
 
@@ -941,14 +1548,15 @@ research_agent_deep = LlmAgent(
     """,
     # output_schema=ResearchAgentOutput,
     output_key="research_deep_output",
+    **_output_cache_callbacks("research_deep_output", _AGENT_CACHE_TTL_SECONDS, before_model_callback=_select_model_callback),
     tools=[exa_search]
 )
 
-# 4. Reorder Agent (1 question, difficulty-adaptive)
+# 3. Reorder Agent (1 question, difficulty-adaptive)
 reorder_agent = LlmAgent(
     name="ReorderAgent", 
     model="gemini-2.0-flash-lite",
-    instruction="""
+    instruction=_state_instruction("""
         You are an expert educational content designer creating REORDER activities. Your goal is to create 1 reorder question that tests sequencing or prioritization skills.
 
         Use the research data from {research_brief_output} and {research_deep_output} to create your question. Adapt your question to the user's difficulty level.
@@ -987,16 +1595,17 @@ reorder_agent = LlmAgent(
                 "explanation": "Explanation of the correct order"
             }
         }
-    """,
+    """, "research_brief_output", "research_deep_output"),
     output_schema=ReorderAgentOutput,
-    output_key="reorder_output"
+    output_key="reorder_output",
+    **_output_cache_callbacks("reorder_output", _AGENT_CACHE_TTL_SECONDS)
 )
 
-# 5. Real-World Impact Agent
+# 4. Real-World Impact Agent
 real_world_impact_agent = LlmAgent(
     name="RealWorldImpactAgent",
-    model="gemini-2.5-flash", 
-    instruction="""
+    model=HedgedGemini(model="gemini-2.5-flash"),
+    instruction=_state_instruction("""
         You are a skilled writer who connects topics to the real world. Your task is to explain why a topic matters *today* and provide real-world use cases that anyone can understand.
 
         REGARDLESS OF DIFFICULTY LEVEL, your real-world use cases must be easy for laypeople to understand.
@@ -1055,31 +1664,53 @@ real_world_impact_agent = LlmAgent(
                 "source_urls": ["url1", "url2", "url3"]
             }
         }
-    """,
+    """, "research_brief_output", "research_deep_output"),
     # output_schema=RealWorldImpactOutput,
     output_key="impact_output",
+    **_output_cache_callbacks("impact_output", _NEWS_AGENT_CACHE_TTL_SECONDS),
     tools=[exa_search]
 )
 
-# 6. Final Quiz Agent (5 questions, difficulty-adaptive)
-final_quiz_agent = LlmAgent(
-    name="FinalQuizAgent", 
-    model="gemini-2.0-flash-lite",
-    instruction="""
-        You are an expert educational content designer creating the FINAL QUIZ. Your goal is to create 5 comprehensive questions that test all learned concepts.
+# 5. Activities Agent (quiz, final quiz and flash cards in one call, difficulty-adaptive)
+_ACTIVITIES_INSTRUCTION = """
+        You are an expert educational content designer. In a single response, create all of the question-based activities and the flash card summary for a learning module.
 
-        Use ALL available research data from {research_brief_output} and {research_deep_output}. Ensure your questions are COMPLETELY DIFFERENT from {quiz_output}.
+        Use the research data from {research_brief_output}, {research_deep_output} and {impact_output}. The user input contains a difficulty level (BEGINNER, INTERMEDIATE, ADVANCED) - adapt everything accordingly:
 
-        Adapt your questions to the user's specified difficulty level (BEGINNER, INTERMEDIATE, ADVANCED).
+        BEGINNER LEVEL QUESTIONS:
+        - Focus on basic definitions and simple concepts
+        - Use straightforward language
+        - Test recall and basic understanding
+        - Include obvious wrong answers to help learning
 
-        Create exactly 5 multiple-choice questions that:
-        - Match the difficulty level
+        INTERMEDIATE LEVEL QUESTIONS:
+        - Test application of concepts
+        - Require some analysis and connection-making
+        - Include plausible distractors
+        - Mix factual and conceptual questions
+
+        ADVANCED LEVEL QUESTIONS:
+        - Test synthesis and evaluation
+        - Require deep understanding and critical thinking
+        - Include subtle distinctions between options
+        - Focus on complex relationships and implications
+
+        QUIZ (the FIRST quiz in the module):
+        - Create exactly 3 multiple-choice questions
+        - Test understanding of FOUNDATIONAL concepts from the brief research
+        - Have 4 answer options each
+        - Include clear explanations for why the correct answer is right
+
+        FINAL QUIZ:
+        - Create exactly 5 multiple-choice questions
         - Cover the full breadth of concepts from both research sections
-        - Are COMPLETELY DIFFERENT from the questions in {quiz_output}
+        - Must be COMPLETELY DIFFERENT from the 3 quiz questions and cover entirely different aspects of the topic
         - Have 4 answer options each
         - Include detailed explanations for the correct answer
 
-        IMPORTANT: Review the questions from {quiz_output} and ensure your 5 questions cover entirely different aspects of the topic.
+        FLASH CARDS:
+        - Distill the most critical information from all of the research into 3-4 flash cards
+        - Each flash card must have a "front" (a question or key term) and a "back" (a concise answer or definition appropriate to the difficulty level)
 
         CRITICAL FORMATTING REQUIREMENTS:
         - You must respond with ONLY a valid JSON object.
@@ -1090,67 +1721,81 @@ final_quiz_agent = LlmAgent(
 
         Required JSON schema:
         {
-            "step": "final_quiz",
+            "step": "activities",
             "type": "activity",
             "data": {
-                "questions": [
+                "quiz": {
+                    "questions": [
+                        {
+                            "question": "Your question text here",
+                            "options": ["Option A", "Option B", "Option C", "Option D"],
+                            "correct_answer": "Option A",
+                            "explanation": "Explanation why this is correct"
+                        }
+                    ]
+                },
+                "final_quiz": {
+                    "questions": [
+                        {
+                            "question": "Your question text here",
+                            "options": ["Option A", "Option B", "Option C", "Option D"],
+                            "correct_answer": "Option A",
+                            "explanation": "Detailed explanation why this is correct"
+                        }
+                    ]
+                },
+                "flash_cards": [
                     {
-                        "question": "Your question text here",
-                        "options": ["Option A", "Option B", "Option C", "Option D"],
-                        "correct_answer": "Option A",
-                        "explanation": "Detailed explanation why this is correct"
+                        "front": "Question or key term here",
+                        "back": "Concise answer or definition here"
                     }
                 ]
             }
         }
-    """,
-    output_schema=FinalQuizAgentOutput,
-    output_key="final_quiz_output"
-)
+    """
 
-# 7. Summary Agent (difficulty-adaptive)
-summary_agent = LlmAgent(
-    name="SummaryAgent",
-    model="gemini-2.0-flash-lite",
-    instruction="""
-        You are a summarization expert. Your job is to distill the most critical information from all provided context into a series of 3-4 flash cards.
+# Research outputs can run long; the activities need the substance of each part,
+# so every input is trimmed to a fixed token budget before it reaches the prompt
+_ACTIVITIES_INPUT_TOKEN_BUDGETS = {
+    "research_brief_output": 800,
+    "research_deep_output": 1500,
+    "impact_output": 400
+}
 
-        Use ALL available data from {research_brief_output}, {research_deep_output}, {impact_output}, and all quiz activities.
 
-        Adapt your flash cards to the user's difficulty level (BEGINNER, INTERMEDIATE, ADVANCED).
+_ACTIVITIES_INSTRUCTION_SEGMENTS = _compile_instruction(
+    _ACTIVITIES_INSTRUCTION, tuple(_ACTIVITIES_INPUT_TOKEN_BUDGETS)
+)
 
-        Each flash card must have a "front" (a question or key term) and a "back" (a concise answer or definition appropriate to the difficulty level).
 
-        CRITICAL FORMATTING REQUIREMENTS: 
-        - You must respond with ONLY a valid JSON object.
-        - DO NOT wrap the JSON in code fences (no ```json or ``` at all).
-        - DO NOT output any explanation, commentary, or extra text outside the JSON.
-        - Your entire response must start with "{" and end with "}".
-        - The JSON must exactly match the required schema.
+def _activities_instruction(context: "ReadonlyContext") -> str:
+    """Fill the activities instruction with token-budgeted copies of the research outputs"""
+    def value(output_key: str) -> str:
+        data = _state_output_data(context.state, output_key)
+        return _json_dumps({
+            "title": data.get("title", ""),
+            "text": trim_to_token_budget(
+                data.get("text") or data.get("content") or "", _ACTIVITIES_INPUT_TOKEN_BUDGETS[output_key]
+            )
+        })
 
-        Required JSON schema: 
-        {
-            "step": "summary",
-            "type": "information",
-            "data": {
-                "flash_cards": [
-                    {
-                        "front": "Question or key term here",
-                        "back": "Concise answer or definition here"
-                    }
-                ]
-            }
-        }
-    """,
-    output_schema=SummaryAgentOutput,
-    output_key="summary_output"
+    return _render_instruction(_ACTIVITIES_INSTRUCTION_SEGMENTS, value)
+
+
+activities_agent = LlmAgent(
+    name="ActivitiesAgent",
+    model="gemini-2.0-flash-lite",
+    instruction=_activities_instruction,
+    output_schema=ActivitiesAgentOutput,
+    output_key="activities_output",
+    **_output_cache_callbacks("activities_output", _AGENT_CACHE_TTL_SECONDS)
 )
 
-# 8. Category, Tags and Description Agent
+# 6. Category, Tags and Description Agent
 category_tags_description_agent = LlmAgent(
     name="CategoryTagsDescriptionAgent",
     model="gemini-2.5-flash",
-    instruction="""
+    instruction=_state_instruction("""
         You are a content categorization and description specialist. Your task is to analyze the educational topic and provide three outputs: select the most appropriate category, create a short description, and generate relevant tags.
 
         Process:
@@ -1183,16 +1828,17 @@ category_tags_description_agent = LlmAgent(
                 "generated_tags": ["tag1", "tag2", "tag3", "tag4", "tag5"]
             }
         }
-    """,
+    """, "research_brief_output", "research_deep_output"),
     # output_schema=CategoryTagsDescriptionOutput,
     output_key="category_tags_description_output",
+    **_output_cache_callbacks("category_tags_description_output", _AGENT_CACHE_TTL_SECONDS),
     tools=[get_categories_from_convex]
 )
 
-# 9. Thumbnail Generator Agent  
+# 7. Thumbnail Generator Agent  
 thumbnail_generator_agent = LlmAgent(
     name="ThumbnailGeneratorAgent",
-    model="gemini-2.5-flash",
+    model="gemini-2.0-flash-lite",
     instruction="""
         You are a visual design specialist. Your task is to find the perfect thumbnail for the educational topic provided.
 
@@ -1223,57 +1869,67 @@ thumbnail_generator_agent = LlmAgent(
     """,
     # output_schema=ThumbnailOutput,
     output_key="thumbnail_output",
+    **_output_cache_callbacks("thumbnail_output", _AGENT_CACHE_TTL_SECONDS),
     tools=[serper_image_search]
 )
 
-# 10. Assembler Agent
-assembler_agent = LlmAgent(
-    name="AssemblerAgent",
-    model="gemini-2.0-flash-lite",
-    instruction="""
-        You are a meticulous JSON formatter. Your job is to take all the content components and assemble them into a single, final JSON object.
+# 8. Assembler Agent
+# Assembly is pure data plumbing, so it runs in Python instead of an LLM call.
+class AssemblerAgent(BaseAgent):
+    """Assembles the sub-agent outputs in session state into the final module without a model call"""
 
-        Process:
-        - The user input will contain: topic, difficulty, created_by, and publish_immediately (optional).
-        - Gather data from all previous agent outputs: {research_brief_output}, {research_deep_output}, {quiz_output}, {reorder_output}, {final_quiz_output}, {impact_output}, {summary_output}, {thumbnail_output}, {category_tags_description_output}.
-        - Extract the "data" field from each agent output and assemble into the final structure.
+    async def _run_async_impl(self, ctx: "InvocationContext") -> AsyncGenerator[Event, None]:
+        try:
+            request = _json_loads(ctx.user_content.parts[0].text)
+        except Exception:
+            request = {}
+        if not isinstance(request, dict):
+            request = {}
+
+        publish_immediately = request.get("publish_immediately", True)
+        if isinstance(publish_immediately, str):
+            publish_immediately = publish_immediately.strip().lower() != "false"
+
+        state = ctx.session.state
+        activities = _state_output_data(state, "activities_output")
+        final_module = {
+            "topic": request.get("topic"),
+            "difficulty": request.get("difficulty", "beginner"),
+            "created_by": request.get("user_id") or request.get("created_by"),
+            "publish_immediately": bool(publish_immediately),
+            "request_id": request.get("request_id"),
+            "research_brief": _state_output_data(state, "research_brief_output"),
+            "research_deep": _state_output_data(state, "research_deep_output"),
+            "quiz": activities.get("quiz", {}),
+            "reorder": _state_output_data(state, "reorder_output"),
+            "final_quiz": activities.get("final_quiz", {}),
+            "real_world_impact": _state_output_data(state, "impact_output"),
+            "flash_cards": activities.get("flash_cards", []),
+            "thumbnail": _state_output_data(state, "thumbnail_output"),
+            "category_tags_description": _state_output_data(state, "category_tags_description_output")
+        }
+        # Match what the LLM assembler's output_schema stored (model_dump(exclude_none=True))
+        final_module = {key: value for key, value in final_module.items() if value is not None}
+
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=_json_dumps(final_module))]),
+            actions=EventActions(state_delta={"final_module": final_module})
+        )
 
-        CRITICAL FORMATTING REQUIREMENTS:
-        - You must respond with ONLY a valid JSON object.
-        - DO NOT wrap the JSON in code fences (no ```json or ``` at all).
-        - DO NOT output any explanation, commentary, or extra text outside the JSON.
-        - Your entire response must start with "{" and end with "}".
-        - The JSON must exactly match the required schema.
-        - Extract only the "data" field from each agent output.
-        - Extract only the flash_cards array from summary_output.data.
-        - publish_immediately must contain only one of the two following values [case-sensitive] - True (or) False. By default use True if not provided. 
 
-        Required JSON schema:
-        {
-            "topic": "The educational topic name from user input",
-            "difficulty": "The difficulty level from user input",
-            "created_by": "The user ID from user input",
-            "publish_immediately": "The publish flag from user input (either True or False [case-sensitive]. Default to True if not provided)",
-            "research_brief": {research_brief_output.data},
-            "research_deep": {research_deep_output.data},
-            "quiz": {quiz_output.data},
-            "reorder": {reorder_output.data},
-            "final_quiz": {final_quiz_output.data},
-            "real_world_impact": {impact_output.data},
-            "flash_cards": [{summary_output.data.flash_cards}],
-            "thumbnail": {thumbnail_output.data},
-            "category_tags_description": {category_tags_description_output.data}
-        }
-    """,
-    output_schema=FinalAssemblyOutput,
-    output_key="final_module"
+assembler_agent = AssemblerAgent(
+    name="AssemblerAgent",
+    description="Assembles all sub-agent outputs into the final module JSON"
 )
 
-# 11. Convex Inserter Agent
+# 9. Convex Inserter Agent
 convex_inserter_agent = LlmAgent(
     name="ConvexInserterAgent",
     model="gemini-2.5-flash",
-    instruction="""
+    instruction=_state_instruction("""
     You are a specialized agent responsible for inserting educational content into a Convex database. Your task is to take the complete JSON from the assembler agent and use a tool to insert it, and then return a JSON response with the required schema.
 
     YOUR PROCESS:
@@ -1310,25 +1966,44 @@ convex_inserter_agent = LlmAgent(
         "message": "Success message or error description",
         "metadata": "Additional metadata about the insertion, null if failed"
     }
-    """,
+    """, "final_module"),
     # output_schema=ConvexInsertionResult,
     output_key="insertion_result",
     tools=[insert_topic_to_convex]
 )
 
-# 12. Orchestrator Agent (Main Controller)
-orchestrator_agent = SequentialAgent(
-    name="OrchestratorAgent",
+# 10. Orchestrator Agent (Main Controller)
+# Agents within a stage only read state written by earlier stages, so each
+# stage runs its agents concurrently and stages run in dependency order.
+
+# Stage 1: needs only the user's topic and difficulty
+brief_research_stage = ParallelAgent(
+    name="BriefResearchStage",
     sub_agents=[
         research_agent_brief,
-        quiz_agent,
-        research_agent_deep,
+        thumbnail_generator_agent
+    ]
+)
+
+# Stage 3: needs research_brief_output and research_deep_output
+activity_stage = ParallelAgent(
+    name="ActivityStage",
+    sub_agents=[
         reorder_agent,
         real_world_impact_agent,
-        final_quiz_agent,
-        summary_agent,
-        category_tags_description_agent,
-        thumbnail_generator_agent,
+        category_tags_description_agent
+    ]
+)
+
+orchestrator_agent = SequentialAgent(
+    name="OrchestratorAgent",
+    sub_agents=[
+        brief_research_stage,
+        # Stage 2: reads the brief agent's reply from the conversation history so
+        # its research goes beyond the basic introductory content
+        research_agent_deep,
+        activity_stage,
+        activities_agent,  # Stage 4: needs all research, including impact_output
         assembler_agent,
         convex_inserter_agent
     ]
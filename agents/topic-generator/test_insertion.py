@@ -6,11 +6,22 @@ Simple test script for insert_topic_to_convex function
 import os
 import json
 import re
-from typing import List, Optional
+import sys
+import time
+from types import MappingProxyType
+from contextlib import nullcontext
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+from unittest.mock import patch
 from convex import ConvexClient
 from google import genai
 from google.genai import types
 
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
 # Load environment variables from .env file
 try:
     from dotenv import load_dotenv
@@ -20,6 +31,40 @@ except ImportError:
     print("⚠️  python-dotenv not installed. Install with: pip install python-dotenv")
     print("   Or set CONVEX_URL manually: export CONVEX_URL='your_url_here'")
 
+_genai_client: Optional[genai.Client] = None
+
+
+def generate_embeddings(texts: List[str], batch_size: int = 64) -> List[List[float]]:
+    """
+    Generate embeddings for several texts, batching up to `batch_size` texts per request.
+    
+    Args:
+        texts: The texts to embed
+        batch_size: Maximum texts per request (the Gemini API accepts at most 100)
+        
+    Returns:
+        List[List[float]]: One embedding vector (768 dimensions) per input text, in order
+    """
+    global _genai_client
+    try:
+        if _genai_client is None:
+            _genai_client = genai.Client()
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            result = _genai_client.models.embed_content(
+                model="gemini-embedding-001",
+                contents=texts[start:start + batch_size],
+                config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY", output_dimensionality=768)
+            )
+            embeddings.extend(embedding.values for embedding in result.embeddings)
+        return embeddings
+        
+    except Exception as e:
+        print(f"Error generating embeddings: {e}")
+        # Return zero vectors as fallback
+        return [[0.0] * 768 for _ in texts]
+
+
 def generate_embedding(text: str) -> List[float]:
     """
     Generate an embedding for the given text.
@@ -30,19 +75,58 @@ def generate_embedding(text: str) -> List[float]:
     Returns:
         List[float]: The embedding vector (768 dimensions)
     """
-    try:
-        client = genai.Client()
-        result = client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=text,
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY", output_dimensionality=768)
-        )
-        return result.embeddings[0].values
-        
-    except Exception as e:
-        print(f"Error generating embedding: {e}")
-        # Return a zero vector as fallback
+    # Blank text has nothing to embed (and the API rejects it)
+    if not text or text.isspace():
         return [0.0] * 768
+    return generate_embeddings([text])[0]
+
+
+_convex_clients: Dict[str, ConvexClient] = {}
+
+def _get_convex_client(convex_url: str) -> ConvexClient:
+    """
+    Return a shared Convex client for the given deployment URL.
+
+    Reusing one client per URL keeps a single connection open across all
+    scenarios; the convex_error scenario gets its own client for the fake URL.
+    """
+    client = _convex_clients.get(convex_url)
+    if client is None:
+        client = ConvexClient(convex_url)
+        _convex_clients[convex_url] = client
+    return client
+
+
+# Categories and notification types are near-static reference data, so repeat
+# lookups within the TTL are served from memory
+_REFERENCE_QUERY_TTL_SECONDS = 300
+_reference_query_cache: Dict[Tuple[int, str], Tuple[float, Any]] = {}
+
+
+def _cached_query(client: ConvexClient, name: str, ttl: float = _REFERENCE_QUERY_TTL_SECONDS) -> Any:
+    """Run an argument-less Convex query, reusing the result for `ttl` seconds per client"""
+    key = (id(client), name)
+    entry = _reference_query_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < ttl:
+        return entry[1]
+    result = client.query(name, {})
+    _reference_query_cache[key] = (time.monotonic(), result)
+    return result
+
+
+def clear_cache() -> None:
+    """Drop all cached reference queries so the next lookup goes to Convex"""
+    _reference_query_cache.clear()
+
+
+def _json_loads(data):
+    """Parse JSON from a str or bytes, using orjson when available"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    """Serialize an object to a JSON string, using orjson when available"""
+    return orjson.dumps(obj).decode() if orjson else json.dumps(obj)
 
 
 def get_categories_from_convex() -> dict:
@@ -58,11 +142,11 @@ def get_categories_from_convex() -> dict:
         if not convex_url:
             return {"success": False, "error": "CONVEX_URL environment variable not set"}
         
-        # Initialize Convex client
-        client = ConvexClient(convex_url)
+        # Get the shared Convex client
+        client = _get_convex_client(convex_url)
         
         # Get all categories
-        categories = client.query("categories:getCategories", {})
+        categories = _cached_query(client, "categories:getCategories")
         
         return {
             "success": True,
@@ -75,19 +159,39 @@ def get_categories_from_convex() -> dict:
             "error": f"Error fetching categories: {str(e)}"
         }
 
+class _SlugTable(dict):
+    """str.translate table for slugs: keeps [a-z0-9-], turns whitespace into '-', drops everything else"""
+
+    def __missing__(self, codepoint: int) -> Optional[str]:
+        char = chr(codepoint)
+        return self.setdefault(codepoint, "-" if char.isspace() else None)
+
+
+_SLUG_TABLE = _SlugTable({ord(c): c for c in "abcdefghijklmnopqrstuvwxyz0123456789-"})
+_RE_DASH = re.compile(r'-{2,}')
+
+
 def create_slug(title: str) -> str:
     """Create a URL-friendly slug from a title"""
-    slug = title.lower().strip()
-    slug = re.sub(r'[^a-z0-9\s-]', '', slug)
-    slug = re.sub(r'\s+', '-', slug)
-    slug = re.sub(r'-+', '-', slug)
-    return slug.strip('-')
+    slug = title.lower().translate(_SLUG_TABLE)
+    return _RE_DASH.sub('-', slug).strip('-')
+
+
+def count_words(text: str) -> int:
+    """Count whitespace-separated words, splitting ASCII text as bytes (faster than str.split)"""
+    if text.isascii():
+        return len(text.encode("ascii").split())
+    return len(text.split())
+
+
+def read_time_from_word_count(words: int) -> int:
+    """Estimate reading time in minutes from an already computed word count"""
+    return max(1, round(words / 225))
 
 
 def estimate_read_time(text: str) -> int:
     """Estimate reading time in minutes based on word count"""
-    words = len(text.split())
-    return max(1, round(words / 225))
+    return read_time_from_word_count(count_words(text))
 
 
 def validate_category_id(category_id: str) -> Optional[str]:
@@ -108,11 +212,11 @@ def validate_category_id(category_id: str) -> Optional[str]:
         if not convex_url:
             return None
         
-        # Initialize Convex client
-        client = ConvexClient(convex_url)
+        # Get the shared Convex client
+        client = _get_convex_client(convex_url)
         
         # Get all categories to validate the ID exists
-        all_categories = client.query("categories:getCategories", {})
+        all_categories = _cached_query(client, "categories:getCategories")
         
         # Check if the provided category_id exists
         for category in all_categories:
@@ -143,12 +247,12 @@ def process_tags(tag_names: List[str]) -> List[str]:
     return [tag.strip() for tag in tag_names if tag and tag.strip()]
 
  
-def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
+def insert_topic_to_convex(agent_output: Union[str, bytes, Mapping[str, Any]], user_id: str, topic: str) -> dict:
     """
     Insert topic data from agent output into Convex database
     
     Args:
-        agent_output: JSON string of the complete agent output containing all necessary data
+        agent_output: The complete agent output, either already parsed or as a JSON string/bytes
         user_id: ID of the user
         topic: The requested topic
         
@@ -160,17 +264,17 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
     if not convex_url:
         return {"success": False, "error": "CONVEX_URL environment variable not set"}
     
-    # Initialize Convex client
-    client = ConvexClient(convex_url)
+    # Get the shared Convex client
+    client = _get_convex_client(convex_url)
     
     # Set default values for error handling
     topic_title = topic
     created_by = user_id
     
     try:
-        # Parse the agent output JSON
-        if isinstance(agent_output, str):
-            output_data = json.loads(agent_output)
+        # Parse the agent output JSON (pre-parsed dicts skip the round-trip entirely)
+        if isinstance(agent_output, (str, bytes)):
+            output_data = _json_loads(agent_output)
         else:
             output_data = agent_output
         
@@ -193,16 +297,16 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
         # Get thumbnail data
         thumbnail = output_data.get("thumbnail", {})
         
-        # Use short description from agent or fallback to brief research
-        description = short_description if short_description else (research_brief.get("text", "")[:500] + "..." if len(research_brief.get("text", "")) > 500 else research_brief.get("text", ""))
+        brief_text = research_brief.get("text", "")
         
-        # Calculate metadata
-        combined_text = (research_brief.get("text", "") + " " + 
-                       research_deep.get("text", "") + " " + 
-                       real_world_impact.get("content", ""))
+        # Use short description from agent or fallback to brief research
+        description = short_description or (brief_text[:500] + "..." if len(brief_text) > 500 else brief_text)
         
-        word_count = len(combined_text.split())
-        estimated_time = estimate_read_time(combined_text)
+        # Calculate metadata (summing per field avoids building a combined copy of all the text)
+        word_count = (count_words(brief_text) +
+                      count_words(research_deep.get("text", "")) +
+                      count_words(real_world_impact.get("content", "")))
+        estimated_time = read_time_from_word_count(word_count)
         
         # Count exercises (only from the blocks we're inserting)
         exercise_count = 0
@@ -213,17 +317,6 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
         if output_data.get("final_quiz", {}).get("questions"):
             exercise_count += len(output_data["final_quiz"]["questions"])
         
-        # Count information blocks
-        info_block_count = 0
-        if research_brief.get("text"):
-            info_block_count += 1
-        if research_deep.get("text"):
-            info_block_count += 1
-        if real_world_impact.get("content"):
-            info_block_count += 1
-        if output_data.get("flash_cards"):
-            info_block_count += 1
-        
         # Validate and use agent-selected category ID
         category_id = validate_category_id(selected_category_id) if selected_category_id else None
         
@@ -243,7 +336,7 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
             "difficulty": difficulty,
             "estimatedReadTime": estimated_time,
             "isAIGenerated": True,
-            "generationPrompt": json.dumps({"topic": topic_title, "difficulty": difficulty}),
+            "generationPrompt": _json_dumps({"topic": topic_title, "difficulty": difficulty}),
             "sources": sources if sources else None,
             "imageUrl": thumbnail.get("thumbnail_url") if thumbnail.get("thumbnail_url") else None,
             "metadata": {
@@ -278,13 +371,12 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
             })
             created_resources["embedding_id"] = embedding_id
             
-            # Create blocks - insert agent outputs directly matching schema
-            order = 0
+            # Collect blocks - agent outputs directly matching schema, inserted in one mutation
+            blocks_to_insert = []
         
             # 1. Brief Research Block (information type)
             if research_brief.get("text"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "information",
                     "content": {
                         "step": "research_brief",
@@ -294,16 +386,13 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "depth": "brief"
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
         
             # 2. Quiz Block (activity type)
             quiz = output_data.get("quiz", {})
             if quiz.get("questions"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "activity",
                     "content": {
                         "step": "quiz",
@@ -311,15 +400,12 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "questions": quiz["questions"]
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
         
             # 3. Deep Research Block (information type)
             if research_deep.get("text"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "information",
                     "content": {
                         "step": "research_deep",
@@ -329,16 +415,13 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "depth": "deep"
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
         
             # 4. Reorder Block (activity type)
             reorder = output_data.get("reorder", {})
             if reorder.get("question"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "activity",
                     "content": {
                         "step": "reorder",
@@ -349,15 +432,12 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "explanation": reorder["explanation"]
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
         
             # 5. Real-World Impact Block (information type)
             if real_world_impact.get("content"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "information",
                     "content": {
                         "step": "real_world_impact",
@@ -367,16 +447,13 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "source_urls": real_world_impact.get("source_urls", [])
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
         
             # 6. Final Quiz Block (activity type)
             final_quiz = output_data.get("final_quiz", {})
             if final_quiz.get("questions"):
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "activity",
                     "content": {
                         "step": "final_quiz",
@@ -384,16 +461,13 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "questions": final_quiz["questions"]
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
         
             # 7. Summary Flash Cards Block (information type)
             flash_cards = output_data.get("flash_cards", [])
             if flash_cards:
-                block_id = client.mutation("blocks:createBlock", {
-                    "topicId": topic_id,
+                blocks_to_insert.append({
                     "type": "information",
                     "content": {
                         "step": "summary",
@@ -401,11 +475,18 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
                             "flash_cards": flash_cards
                         }
                     },
-                    "order": order
+                    "order": len(blocks_to_insert)
                 })
-                created_resources["block_ids"].append(block_id)
-                order += 1
-        
+
+            # Count information blocks from the blocks we're inserting
+            info_block_count = sum(1 for block in blocks_to_insert if block["type"] == "information")
+
+            if blocks_to_insert:
+                created_resources["block_ids"] = client.mutation("blocks:createBlocksBulk", {
+                    "topicId": topic_id,
+                    "blocks": blocks_to_insert
+                })
+
             # Note: Thumbnail and category data are stored in the topic record itself,
             # not as separate blocks, to match the schema union constraints
             
@@ -442,7 +523,7 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
             raise block_error
         
         # Get the notification type for topic_generated
-        notification_types = client.query("notifications:getNotificationTypes")
+        notification_types = _cached_query(client, "notifications:getNotificationTypes")
         topic_generated_type = None
         for nt in notification_types:
             if nt.get("key") == "topic_generated":
@@ -524,7 +605,7 @@ def insert_topic_to_convex(agent_output: str, user_id: str, topic: str) -> dict:
         # Create error notification
         try:
             # Get the notification type for errors
-            notification_types = client.query("notifications:getNotificationTypes")
+            notification_types = _cached_query(client, "notifications:getNotificationTypes")
             error_notification_type = None
             for nt in notification_types:
                 if nt.get("key") == "error":
@@ -734,142 +815,152 @@ minimal_test_data = {
 }
 }
 
+_ENV_FILE_CACHE = None
+
+def _env_file_values() -> Dict[str, Optional[str]]:
+    """Parse .env once and cache the result, using python-dotenv when it is installed"""
+    global _ENV_FILE_CACHE
+    if _ENV_FILE_CACHE is None:
+        try:
+            from dotenv import dotenv_values
+            _ENV_FILE_CACHE = dotenv_values(".env")
+        except ImportError:
+            # Minimal KEY=value parsing when python-dotenv isn't available
+            _ENV_FILE_CACHE = {}
+            with open(".env", "r") as f:
+                for line in f:
+                    key, sep, value = line.strip().removeprefix("export ").partition("=")
+                    if sep and not key.startswith("#"):
+                        _ENV_FILE_CACHE[key.strip()] = value.strip()
+    return _ENV_FILE_CACHE
+
+def _flush_log(log: List[str]):
+    """Write buffered log lines to stdout in one call and clear the buffer"""
+    if log:
+        sys.stdout.write("\n".join(log) + "\n")
+        sys.stdout.flush()
+        log.clear()
+
+# Read-only view of the fixture so scenarios can't mutate it by accident
+MINIMAL_TEST_DATA = MappingProxyType(minimal_test_data)
+
+def _override(base, **overrides) -> dict:
+    """Return a new payload with top-level keys replaced, sharing the untouched subtrees"""
+    return {**base, **overrides}
+
+# Every scenario as (banner, payload, user_id, topic, env_overrides), built once at import
+# and shared by run_test and test_all_error_scenarios
+_SCENARIOS = {
+    "invalid_json": (
+        "🔥 Testing with INVALID JSON to trigger JSON parsing error...",
+        b'{"topic": "Test Topic", "difficulty": "beginner", "invalid_json": true',  # Missing closing brace
+        "test_user_123", "Test Topic", None
+    ),
+    "missing_fields": (
+        "🔥 Testing with MISSING REQUIRED FIELDS to trigger field access error...",
+        {"topic": "Test Topic", "difficulty": "beginner"},  # Missing research_brief, research_deep, etc.
+        "test_user_123", "Test Topic", None
+    ),
+    "convex_error": (
+        "🔥 Testing with INVALID CONVEX URL to trigger connection error...",
+        MINIMAL_TEST_DATA,
+        "test_user_123", "Hedge funds", {"CONVEX_URL": "https://invalid-convex-url.convex.cloud"}
+    ),
+    "block_creation_error": (
+        "🔥 Testing with INVALID BLOCK DATA to trigger block creation error...",
+        # Corrupt the research_brief text so the insert fails after validation
+        _override(MINIMAL_TEST_DATA, research_brief={"title": "Valid Title", "text": None, "depth": "brief"}),
+        "test_user_123", "Hedge funds", None
+    ),
+    "normal": (
+        "🔥 Running NORMAL test...",
+        MINIMAL_TEST_DATA,
+        "test_user_123", "Hedge funds", None
+    ),
+}
+
+def _run_scenario(name: str, log: List[str]) -> dict:
+    """Run one scenario from _SCENARIOS, scoping any environment overrides to the insert call"""
+    banner, payload, user_id, topic, env_overrides = _SCENARIOS[name]
+    log.append(banner)
+    # Flush before the insert so its own output stays in order
+    _flush_log(log)
+    with patch.dict(os.environ, env_overrides) if env_overrides else nullcontext():
+        return insert_topic_to_convex(payload, user_id, topic)
+
 def run_test():
     """Run a simple test of the insert function"""
-    print("🧪 Simple Convex Insert Test")
-    print("-" * 30)
+    log = ["🧪 Simple Convex Insert Test", "-" * 30]
+    p = log.append
     
     # Check environment
     convex_url = os.environ.get("CONVEX_URL")
     if not convex_url:
-        print("❌ CONVEX_URL not set.")
-        print("   Options to fix this:")
-        print("   1. Install python-dotenv: pip install python-dotenv")
-        print("   2. Set manually: export CONVEX_URL='your_url_here'")
-        print("   3. Add to your .env file: CONVEX_URL=your_url_here")
+        p("❌ CONVEX_URL not set.")
+        p("   Options to fix this:")
+        p("   1. Install python-dotenv: pip install python-dotenv")
+        p("   2. Set manually: export CONVEX_URL='your_url_here'")
+        p("   3. Add to your .env file: CONVEX_URL=your_url_here")
         
         # Check if .env file exists
-        if os.path.exists(".env"):
-            print("   ✅ .env file found - make sure it contains CONVEX_URL")
-            with open(".env", "r") as f:
-                content = f.read()
-                if "CONVEX_URL" in content:
-                    print("   ✅ CONVEX_URL found in .env file")
-                else:
-                    print("   ❌ CONVEX_URL not found in .env file")
+        if os.path.isfile(".env"):
+            p("   ✅ .env file found - make sure it contains CONVEX_URL")
+            if "CONVEX_URL" in _env_file_values():
+                p("   ✅ CONVEX_URL found in .env file")
+            else:
+                p("   ❌ CONVEX_URL not found in .env file")
         else:
-            print("   ❌ .env file not found")
+            p("   ❌ .env file not found")
+        _flush_log(log)
         return
     
-    print("✅ Environment ready")
-    # print(f"📝 Testing with topic: '{minimal_test_data['topic']}'")
+    p("✅ Environment ready")
+    # p(f"📝 Testing with topic: '{MINIMAL_TEST_DATA['topic']}'")
     
     # Choose which error to test (uncomment one):
-    test_error_type = "block_creation_error"  # Options: "invalid_json", "missing_fields", "convex_error", "block_creation_error"
+    test_error_type = "block_creation_error"  # Options: "invalid_json", "missing_fields", "convex_error", "block_creation_error", "normal"
     
-    if test_error_type == "invalid_json":
-        print("🔥 Testing with INVALID JSON to trigger JSON parsing error...")
-        # Introduce malformed JSON
-        invalid_json = '{"topic": "Test Topic", "difficulty": "beginner", "invalid_json": true'  # Missing closing brace
-        result = insert_topic_to_convex(invalid_json, "test_user_123", "Test Topic")
-        
-    elif test_error_type == "missing_fields":
-        print("🔥 Testing with MISSING REQUIRED FIELDS to trigger field access error...")
-        # Remove required fields
-        incomplete_data = {
-            "topic": "Test Topic",
-            "difficulty": "beginner"
-            # Missing research_brief, research_deep, etc.
-        }
-        result = insert_topic_to_convex(json.dumps(incomplete_data), "test_user_123", "Test Topic")
-        
-    elif test_error_type == "block_creation_error":
-        print("🔥 Testing with INVALID BLOCK DATA to trigger block creation error...")
-        # Create data that will pass initial validation but fail during block creation
-        # We'll corrupt the research_brief text to cause block creation to fail
-        test_data = minimal_test_data.copy()
-        test_data["research_brief"] = {
-            "title": "Valid Title",
-            "text": None,  # This will cause block creation to fail when trying to access text
-            "depth": "brief"
-        }
-        result = insert_topic_to_convex(json.dumps(test_data), "test_user_123", "Hedge funds")
-        
-    elif test_error_type == "convex_error":
-        print("🔥 Testing with INVALID CONVEX URL to trigger connection error...")
-        # Temporarily set invalid Convex URL
-        original_url = os.environ.get("CONVEX_URL")
-        os.environ["CONVEX_URL"] = "https://invalid-convex-url.convex.cloud"
-        result = insert_topic_to_convex(json.dumps(minimal_test_data), "test_user_123", "Hedge funds")
-        # Restore original URL
-        if original_url:
-            os.environ["CONVEX_URL"] = original_url
-    else:
-        # Normal test
-        print("🔥 Running NORMAL test...")
-        result = insert_topic_to_convex(json.dumps(minimal_test_data), "test_user_123", "Hedge funds")
+    result = _run_scenario(test_error_type, log)
     
     # Print results
     if result.get("success"):
-        print(f"✅ SUCCESS! Topic ID: {result.get('topic_id')}")
-        print(f"📊 Exercises: {result.get('metadata', {}).get('exercise_count', 0)}")
+        p(f"✅ SUCCESS! Topic ID: {result.get('topic_id')}")
+        p(f"📊 Exercises: {result.get('metadata', {}).get('exercise_count', 0)}")
     else:
-        print(f"❌ FAILED: {result.get('message', result.get('error', 'Unknown error'))}")
-        print(f"🔍 Full result: {result}")
+        p(f"❌ FAILED: {result.get('message', result.get('error', 'Unknown error'))}")
+        p(f"🔍 Full result: {result}")
+    _flush_log(log)
 
 def test_all_error_scenarios():
     """Test all different error scenarios"""
-    print("🧪 Testing All Error Scenarios")
-    print("=" * 50)
+    log = ["🧪 Testing All Error Scenarios", "=" * 50]
+    p = log.append
     
-    error_types = ["invalid_json", "missing_fields", "convex_error", "block_creation_error"]
+    error_types = [name for name in _SCENARIOS if name != "normal"]
+    # Start from a cold cache so each run sees the current reference data
+    clear_cache()
     
     for i, error_type in enumerate(error_types, 1):
-        print(f"\n{i}. Testing {error_type.replace('_', ' ').title()}:")
-        print("-" * 30)
+        p(f"\n{i}. Testing {error_type.replace('_', ' ').title()}:")
+        p("-" * 30)
         
         try:
-            if error_type == "invalid_json":
-                print("🔥 Malformed JSON test...")
-                invalid_json = '{"topic": "Test", "incomplete": true'  # Missing closing brace
-                result = insert_topic_to_convex(invalid_json, "test_user_123", "Test Topic")
-                
-            elif error_type == "missing_fields":
-                print("🔥 Missing required fields test...")
-                incomplete_data = {"topic": "Test", "difficulty": "beginner"}
-                result = insert_topic_to_convex(json.dumps(incomplete_data), "test_user_123", "Test Topic")
-                
-            elif error_type == "block_creation_error":
-                print("🔥 Block creation error test...")
-                test_data = minimal_test_data.copy()
-                test_data["research_brief"] = {
-                    "title": "Valid Title",
-                    "text": None,  # This will cause block creation to fail
-                    "depth": "brief"
-                }
-                result = insert_topic_to_convex(json.dumps(test_data), "test_user_123", "Hedge funds")
-                
-            elif error_type == "convex_error":
-                print("🔥 Convex connection error test...")
-                original_url = os.environ.get("CONVEX_URL")
-                os.environ["CONVEX_URL"] = "https://fake-url.convex.cloud"
-                result = insert_topic_to_convex(json.dumps(minimal_test_data), "test_user_123", "Hedge funds")
-                if original_url:
-                    os.environ["CONVEX_URL"] = original_url
+            result = _run_scenario(error_type, log)
             
             # Print results
             if result.get("success"):
-                print(f"   ✅ Unexpected success: {result.get('topic_id')}")
+                p(f"   ✅ Unexpected success: {result.get('topic_id')}")
             else:
-                print(f"   ❌ Expected failure: {result.get('message', result.get('error', 'Unknown'))}")
+                p(f"   ❌ Expected failure: {result.get('message', result.get('error', 'Unknown'))}")
                 
         except Exception as e:
-            print(f"   💥 Exception caught: {e}")
+            p(f"   💥 Exception caught: {e}")
     
-    print(f"\n{'='*50}")
-    print("🎯 Error scenario testing complete!")
+    p(f"\n{'='*50}")
+    p("🎯 Error scenario testing complete!")
+    _flush_log(log)
 
 if __name__ == "__main__":
     # Uncomment the test you want to run:
     run_test()  # Single test with configurable error type
-    # test_all_error_scenarios()  # Test all error scenarios
\ No newline at end of file
+    # test_all_error_scenarios()  # Test all error scenarios
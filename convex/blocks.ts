@@ -42,6 +42,32 @@ export const createBlock = mutation({
   },
 });
 
+/**
+ * Create all blocks for a topic in a single transaction (used by the agent)
+ */
+export const createBlocksBulk = mutation({
+  args: {
+    topicId: v.id("topics"),
+    blocks: v.array(
+      v.object({
+        type: v.union(v.literal("information"), v.literal("activity")),
+        content: blockContentValidator,
+        order: v.number(),
+      })
+    ),
+  },
+  returns: v.array(v.id("blocks")),
+  handler: async (ctx, args) => {
+    const blockIds = [];
+    for (const block of args.blocks) {
+      blockIds.push(
+        await ctx.db.insert("blocks", { topicId: args.topicId, ...block })
+      );
+    }
+    return blockIds;
+  },
+});
+
 /**
  * Delete a block (used for cleanup when creation fails)
  */
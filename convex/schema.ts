@@ -126,6 +126,7 @@ export default defineSchema({
     lastUpdated: v.number(),
     isAIGenerated: v.boolean(),
     generationPrompt: v.optional(v.string()),
+    dedupeHash: v.optional(v.string()), // sha256 of requestId|title|difficulty|createdBy for AI-generated topics
     sources: v.optional(v.array(v.string())),
     metadata: v.optional(
       v.object({
@@ -141,6 +142,7 @@ export default defineSchema({
     .index("by_trending", ["isTrending"])
     .index("by_published", ["isPublished"])
     .index("by_created_by", ["createdBy"])
+    .index("by_dedupe_hash", ["dedupeHash"])
     .searchIndex("search_topics", {
       searchField: "title",
       filterFields: ["categoryId", "isPublished", "isTrending"],
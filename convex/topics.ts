@@ -4,8 +4,9 @@ import {
   internalMutation,
   internalQuery,
   action,
+  MutationCtx,
 } from "./_generated/server";
-import { v } from "convex/values";
+import { Infer, v } from "convex/values";
 import { paginationOptsValidator } from "convex/server";
 import { blockContentValidator } from "./schema";
 import { internal } from "./_generated/api";
@@ -45,6 +46,7 @@ export const getTrendingTopics = query({
       lastUpdated: v.number(),
       isAIGenerated: v.boolean(),
       generationPrompt: v.optional(v.string()),
+      dedupeHash: v.optional(v.string()),
       sources: v.optional(v.array(v.string())),
       metadata: v.optional(
         v.object({
@@ -143,6 +145,7 @@ export const searchTopics = query({
       lastUpdated: v.number(),
       isAIGenerated: v.boolean(),
       generationPrompt: v.optional(v.string()),
+      dedupeHash: v.optional(v.string()),
       sources: v.optional(v.array(v.string())),
       metadata: v.optional(
         v.object({
@@ -212,6 +215,7 @@ export const getTopicBySlug = query({
         lastUpdated: v.number(),
         isAIGenerated: v.boolean(),
         generationPrompt: v.optional(v.string()),
+        dedupeHash: v.optional(v.string()),
         sources: v.optional(v.array(v.string())),
         metadata: v.optional(
           v.object({
@@ -299,48 +303,201 @@ export const getTopics = query({
   },
 });
 
+const createTopicFields = {
+  title: v.string(),
+  description: v.string(),
+  slug: v.string(),
+  categoryId: v.optional(v.id("categories")),
+  tagIds: v.array(v.string()),
+  imageUrl: v.optional(v.string()),
+  difficulty: v.union(
+    v.literal("beginner"),
+    v.literal("intermediate"),
+    v.literal("advanced")
+  ),
+  estimatedReadTime: v.number(),
+  createdBy: v.optional(v.string()),
+  isAIGenerated: v.optional(v.boolean()),
+  generationPrompt: v.optional(v.string()),
+  dedupeHash: v.optional(v.string()),
+  sources: v.optional(v.array(v.string())),
+  metadata: v.optional(
+    v.object({
+      wordCount: v.number(),
+      readingLevel: v.any(),
+      estimatedTime: v.optional(v.number()),
+      exerciseCount: v.optional(v.number()),
+    })
+  ),
+};
+
+const createTopicValidator = v.object(createTopicFields);
+
+async function insertTopic(
+  ctx: MutationCtx,
+  fields: Infer<typeof createTopicValidator>
+): Promise<Id<"topics">> {
+  return await ctx.db.insert("topics", {
+    ...fields,
+    isPublished: true,
+    isTrending: false,
+    viewCount: 0,
+    likeCount: 0,
+    shareCount: 0,
+    lastUpdated: Date.now(),
+    isAIGenerated: fields.isAIGenerated ?? false,
+  });
+}
+
 /**
  * Create a new topic (public function for content generation)
  */
 export const createTopic = mutation({
+  args: createTopicFields,
+  returns: v.id("topics"),
+  handler: async (ctx, args) => {
+    return await insertTopic(ctx, args);
+  },
+});
+
+/**
+ * Create a topic together with its embedding, blocks and success notification
+ * in one transaction (used by the agent). Every step uses the new topic ID, so
+ * doing them server-side replaces a chain of dependent round trips; if any step
+ * fails, nothing is written.
+ *
+ * If a topic with the same dedupeHash already exists (a retry of the same
+ * generation request), nothing new is written and the existing topic is
+ * returned along with its success notification, which is sent now if it is
+ * missing. The check runs in the same transaction, so concurrent retries can't
+ * both insert.
+ */
+export const createTopicProgram = mutation({
   args: {
-    title: v.string(),
-    description: v.string(),
-    slug: v.string(),
-    categoryId: v.optional(v.id("categories")),
-    tagIds: v.array(v.string()),
-    imageUrl: v.optional(v.string()),
-    difficulty: v.union(
-      v.literal("beginner"),
-      v.literal("intermediate"),
-      v.literal("advanced")
+    topic: createTopicValidator,
+    // Category picked by the agent; unknown IDs fall back to the "Other" category
+    selectedCategoryId: v.optional(v.string()),
+    embedding: v.object({
+      contentType: v.union(
+        v.literal("research_brief"),
+        v.literal("research_deep"),
+        v.literal("combined_content")
+      ),
+      embedding: v.array(v.float64()),
+    }),
+    blocks: v.array(
+      v.object({
+        type: v.union(v.literal("information"), v.literal("activity")),
+        content: blockContentValidator,
+        order: v.number(),
+      })
     ),
-    estimatedReadTime: v.number(),
-    createdBy: v.optional(v.string()),
-    isAIGenerated: v.optional(v.boolean()),
-    generationPrompt: v.optional(v.string()),
-    sources: v.optional(v.array(v.string())),
-    metadata: v.optional(
+    notification: v.optional(
       v.object({
-        wordCount: v.number(),
-        readingLevel: v.any(),
-        estimatedTime: v.optional(v.number()),
-        exerciseCount: v.optional(v.number()),
+        userId: v.string(),
+        typeKey: v.string(),
+        title: v.string(),
+        message: v.string(),
+        data: v.optional(v.any()),
       })
     ),
   },
-  returns: v.id("topics"),
+  returns: v.object({
+    topicId: v.id("topics"),
+    embeddingId: v.union(v.id("embeddings"), v.null()),
+    blockIds: v.array(v.id("blocks")),
+    notificationId: v.union(v.id("notifications"), v.null()),
+    deduped: v.boolean(),
+  }),
   handler: async (ctx, args) => {
-    return await ctx.db.insert("topics", {
-      ...args,
-      isPublished: true,
-      isTrending: false,
-      viewCount: 0,
-      likeCount: 0,
-      shareCount: 0,
-      lastUpdated: Date.now(),
-      isAIGenerated: args.isAIGenerated ?? false,
+    const { contentType, embedding } = args.embedding;
+
+    const insertNotification = async (topicId: Id<"topics">) => {
+      if (!args.notification) {
+        return null;
+      }
+      const { typeKey, data, ...notification } = args.notification;
+      const notificationType = await ctx.db
+        .query("notificationTypes")
+        .withIndex("by_key", (q) => q.eq("key", typeKey))
+        .first();
+      if (!notificationType) {
+        return null;
+      }
+      return await ctx.db.insert("notifications", {
+        ...notification,
+        notificationTypeKey: notificationType._id,
+        isRead: false,
+        isArchived: false,
+        data: { ...data, topicId },
+      });
+    };
+
+    const dedupeHash = args.topic.dedupeHash;
+    if (dedupeHash !== undefined) {
+      const existing = await ctx.db
+        .query("topics")
+        .withIndex("by_dedupe_hash", (q) => q.eq("dedupeHash", dedupeHash))
+        .first();
+      if (existing) {
+        let notificationId: Id<"notifications"> | null = null;
+        if (args.notification) {
+          const userId = args.notification.userId;
+          const sent = await ctx.db
+            .query("notifications")
+            .withIndex("by_user", (q) => q.eq("userId", userId))
+            .filter((q) => q.eq(q.field("data.topicId"), existing._id))
+            .first();
+          notificationId = sent?._id ?? (await insertNotification(existing._id));
+        }
+        return {
+          topicId: existing._id,
+          embeddingId: null,
+          blockIds: [],
+          notificationId,
+          deduped: true,
+        };
+      }
+    }
+
+    let categoryId = args.topic.categoryId;
+    if (categoryId === undefined && args.selectedCategoryId !== undefined) {
+      const selectedId = ctx.db.normalizeId("categories", args.selectedCategoryId);
+      const selected = selectedId ? await ctx.db.get(selectedId) : null;
+      let category =
+        selected ??
+        (await ctx.db
+          .query("categories")
+          .withIndex("by_name", (q) => q.eq("name", "Other"))
+          .first());
+      if (!category) {
+        // The name match is case-insensitive, as it was in the agent's old lookup
+        const categories = await ctx.db.query("categories").collect();
+        category =
+          categories.find((c) => c.name.toLowerCase() === "other") ?? null;
+      }
+      categoryId = category?._id;
+    }
+
+    // Topics are created published, so no separate publish step is needed
+    const topicId = await insertTopic(ctx, { ...args.topic, categoryId });
+
+    const embeddingId = await ctx.db.insert("embeddings", {
+      topicId,
+      embedding,
+      contentType,
+      difficulty: args.topic.difficulty,
+      categoryId,
     });
+
+    const blockIds = [];
+    for (const block of args.blocks) {
+      blockIds.push(await ctx.db.insert("blocks", { topicId, ...block }));
+    }
+
+    const notificationId = await insertNotification(topicId);
+
+    return { topicId, embeddingId, blockIds, notificationId, deduped: false };
   },
 });
 
@@ -411,6 +568,7 @@ export const getTopicById = query({
         lastUpdated: v.number(),
         isAIGenerated: v.boolean(),
         generationPrompt: v.optional(v.string()),
+        dedupeHash: v.optional(v.string()),
         sources: v.optional(v.array(v.string())),
         metadata: v.optional(
           v.object({
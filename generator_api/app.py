@@ -1,75 +1,260 @@
 import os
 import json
+import logging
 import time
-import re
+import threading
+import uuid
+from collections import OrderedDict
 import requests
-from convex import ConvexClient
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Union
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    # msgspec is optional; topic checker output is then parsed with parse_json_from_markdown
+    msgspec = None
+
+
+if msgspec:
+    class TopicValidationResult(msgspec.Struct):
+        """Topic checker output (mirrors TopicValidationOutput in agents/topic-checker)"""
+        status: str
+        reason: Optional[str] = None
+
+    class TopicRequest(msgspec.Struct):
+        """Request body of /check-topic and /generate-topic"""
+        topic: Optional[str] = None
+        user_id: Optional[str] = None
+        difficulty: Optional[str] = 'Beginner'
+        publish_immediately: Union[bool, str, None] = 'True'
+
+    # Just the parts of an ADK /run event that extract_model_text reads; msgspec skips
+    # every other field (actions, usage metadata, function calls) without building it
+    class EventPart(msgspec.Struct):
+        text: Optional[str] = None
+
+    class EventContent(msgspec.Struct):
+        role: Optional[str] = None
+        parts: Optional[List[EventPart]] = None
+
+    class RunEvent(msgspec.Struct):
+        content: Optional[EventContent] = None
+
+    _run_events_decoder = msgspec.json.Decoder(List[RunEvent])
+
+def _json_loads(data):
+    """Parse JSON from a str or bytes, using orjson when available"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_dumps(obj):
+    """Serialize an object to a JSON string, using orjson when available"""
+    return orjson.dumps(obj).decode() if orjson else json.dumps(obj)
+
+def _json_bytes(obj):
+    """Serialize an object to UTF-8 JSON bytes, using orjson when available"""
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+if orjson:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson, so jsonify() and request.get_json() skip the stdlib encoder"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            # Hand orjson's UTF-8 bytes straight to the response instead of decoding to str first
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
+# Load environment variables from .env, unless the platform already provides them
+if not (os.getenv('TOPIC_CHECKER_BASE_URL') and os.getenv('TOPIC_GENERATOR_BASE_URL')):
+    load_dotenv()
 
 app = Flask(__name__)
 
+# One stream handler for the service; LOG_LEVEL=DEBUG also logs unparseable model output
+logger = logging.getLogger("generator_api")
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+    logger.addHandler(_log_handler)
+    logger.propagate = False
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+if orjson:
+    app.json = OrjsonProvider(app)
+
 # Environment variables
 TOPIC_CHECKER_BASE_URL = os.getenv('TOPIC_CHECKER_BASE_URL')
 TOPIC_GENERATOR_BASE_URL = os.getenv('TOPIC_GENERATOR_BASE_URL')
-CONVEX_URL = os.getenv("CONVEX_URL")
 
-client = ConvexClient(CONVEX_URL)
+# Shared HTTP session so calls to the ADK servers reuse keep-alive connections
+# instead of a fresh TCP/TLS handshake per request. Failed connects are retried
+# for every method (nothing was sent yet); read errors never are, and status
+# retries only cover idempotent methods (urllib3's default), so a /run POST is never replayed.
+http_session = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+)
+http_session.mount("http://", _http_adapter)
+http_session.mount("https://", _http_adapter)
+http_session.headers["Content-Type"] = "application/json"
+
+# (connect, read) timeouts. Agent runs can take minutes, so /run gets a generous read
+# timeout, but a bounded one so a stuck upstream can't hold a worker thread forever
+SESSION_REQUEST_TIMEOUT = (3, 30)
+RUN_REQUEST_TIMEOUT = (3, float(os.getenv('RUN_READ_TIMEOUT_SECONDS', '600')))
 
-def create_session(base_url, user_id, session_id):
+# Session management that responses don't need to wait on runs in the background:
+# deletes, and creating the generator session while /generate-topic checks the topic.
+# Sized to gunicorn's 16 threads so a burst of deletes can't hold up a waiting create
+_session_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="session-io")
+
+def new_session_id(user_id):
+    """Return a session ID that can't collide between concurrent requests from the same user
+    
+    The timestamp keeps IDs readable in logs; the random suffix keeps them unique across
+    requests in the same second and across gunicorn worker processes
+    """
+    return f"session_{user_id}_{int(time.time())}_{uuid.uuid4().hex[:12]}"
+
+# Initial session state, serialized once
+_CREATE_SESSION_BODY = _json_bytes({"state": {"preferred_language": "English"}})
+
+def create_session(base_url, app_name, user_id, session_id):
     """Create a session for the given service"""
-    url = f"{base_url}/apps/{'topic-checker' if 'topic-checker' in base_url else 'topic-generator'}/users/{user_id}/sessions/{session_id}"
-    payload = {"state": {"preferred_language": "English"}}
+    url = f"{base_url}/apps/{app_name}/users/{user_id}/sessions/{session_id}"
     
-    response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+    response = http_session.post(url, data=_CREATE_SESSION_BODY, timeout=SESSION_REQUEST_TIMEOUT)
     return response
 
+# Fixed /run request frame; the JSON-encoded app name, user, session and message are spliced in
+_RUN_PAYLOAD_TEMPLATE = (
+    b'{"app_name":%b,"user_id":%b,"session_id":%b,'
+    b'"new_message":{"role":"user","parts":[{"text":%b}]},"streaming":false}'
+)
+
 def run_service(base_url, app_name, user_id, session_id, message_text):
     """Run the service with the given parameters"""
     url = f"{base_url}/run"
-    payload = {
-        "app_name": app_name,
-        "user_id": user_id,
-        "session_id": session_id,
-        "new_message": {
-            "role": "user",
-            "parts": [{"text": message_text}]
-        },
-        "streaming": False
-    }
+    body = _RUN_PAYLOAD_TEMPLATE % (
+        _json_bytes(app_name),
+        _json_bytes(user_id),
+        _json_bytes(session_id),
+        _json_bytes(message_text)
+    )
     
-    response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+    response = http_session.post(url, data=body, timeout=RUN_REQUEST_TIMEOUT)
     return response
 
 def delete_session(base_url, app_name, user_id, session_id):
     """Delete the session"""
     url = f"{base_url}/apps/{app_name}/users/{user_id}/sessions/{session_id}"
-    response = requests.delete(url)
+    response = http_session.delete(url, timeout=SESSION_REQUEST_TIMEOUT)
     return response
 
+def _delete_session_quietly(base_url, app_name, user_id, session_id):
+    """Delete the session, logging failures instead of raising (runs on the session executor)"""
+    try:
+        response = delete_session(base_url, app_name, user_id, session_id)
+        if response.status_code not in (200, 204, 404):
+            logger.warning("Failed to delete session %s: HTTP %s", session_id, response.status_code)
+    except Exception as e:
+        logger.warning("Failed to delete session %s: %s", session_id, e)
+
+def delete_session_async(base_url, app_name, user_id, session_id):
+    """Delete the session in the background without blocking the caller"""
+    return _session_executor.submit(_delete_session_quietly, base_url, app_name, user_id, session_id)
+
+def discard_session_when_created(create_future, base_url, app_name, user_id, session_id):
+    """Delete a session that is being created in the background once its create call finishes"""
+    create_future.add_done_callback(
+        lambda _: delete_session_async(base_url, app_name, user_id, session_id)
+    )
+
 def extract_model_response(response_data):
     """Extract the latest model response from the API response"""
     try:
         if isinstance(response_data, list) and len(response_data) > 0:
             # Find the latest model response
+            # The final model turn is normally the last event, so this usually stops after one item
             for item in reversed(response_data):
-                if (item.get('content', {}).get('role') == 'model' and 
-                    'parts' in item.get('content', {}) and 
-                    len(item['content']['parts']) > 0):
-                    
-                    parts = item['content']['parts']
-                    for part in parts:
-                        if 'text' in part:
-                            return part['text']
+                content = item.get('content')
+                if not content or content.get('role') != 'model':
+                    continue
+                for part in content.get('parts') or ():
+                    if 'text' in part:
+                        return part['text']
         
         return None
     except Exception as e:
-        print(f"Error extracting model response: {e}", flush=True)
+        logger.error("Error extracting model response: %s", e)
         return None
 
+def extract_model_text(body):
+    """Extract the latest model text from a raw ADK /run response body
+    
+    With msgspec, only each event's content role and part texts are decoded;
+    otherwise (or if the body doesn't fit that shape) the whole body is parsed
+    and handed to extract_model_response
+    """
+    if msgspec:
+        try:
+            events = _run_events_decoder.decode(body)
+        except msgspec.DecodeError:
+            events = None
+        if events is not None:
+            for event in reversed(events):
+                content = event.content
+                if content is None or content.role != 'model':
+                    continue
+                for part in content.parts or ():
+                    if part.text is not None:
+                        return part.text
+            return None
+    return extract_model_response(_json_loads(body))
+
+def extract_fenced_block(text, opener):
+    """Return the body of the first markdown code fence opened by `opener`, or None
+    
+    A str.find scan standing in for the regex opener + r'\s*\n(.*?)\n```' (DOTALL):
+    the opener must be followed by whitespace containing a newline, and the body
+    runs from after the last of those newlines up to the next line starting with ```
+    """
+    start = text.find(opener)
+    while start >= 0:
+        pos = start + len(opener)
+        body_start = prev_body_start = -1
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+            if text[pos - 1] == '\n':
+                prev_body_start, body_start = body_start, pos
+        if body_start >= 0:
+            end = text.find('\n```', body_start)
+            if end >= 0:
+                return text[body_start:end]
+            # The whitespace run itself ends in a closing fence (the regex backtracks onto it)
+            if prev_body_start >= 0 and text.startswith('```', body_start):
+                return text[prev_body_start:body_start - 1]
+            return None
+        start = text.find(opener, start + 1)
+    return None
+
 def parse_json_from_markdown(text):
     """Parse JSON from markdown code blocks or plain text
     
@@ -86,49 +271,108 @@ def parse_json_from_markdown(text):
         - parsed_json: The parsed JSON object or None if parsing failed
         - should_retry: True if success is false (triggers 500 error for QStash retry)
     """
+    # First, try to parse as direct JSON. Only text that starts like JSON is tried;
+    # anything else (normally fenced output) would just raise, so it skips to the fence search
+    direct_error = None
+    if text.lstrip()[:1] in ('{', '['):
+        try:
+            parsed_json = _json_loads(text)
+            should_retry = parsed_json.get('success') is False
+            return parsed_json, should_retry
+        except json.JSONDecodeError as e:
+            direct_error = e
+    
     try:
-        # First, try to parse as direct JSON
-        parsed_json = json.loads(text)
+        # If that fails, look for JSON within markdown code blocks
+        # Match ```json\n...content...\n```
+        json_content = extract_fenced_block(text, '```json')
+        
+        if json_content is not None:
+            parsed_json = _json_loads(json_content)
+            should_retry = parsed_json.get('success') is False
+            return parsed_json, should_retry
+        
+        # Match ```\n...content...\n``` (without json specifier)
+        json_content = extract_fenced_block(text, '```')
+        
+        if json_content is not None:
+            parsed_json = _json_loads(json_content)
+            should_retry = parsed_json.get('success') is False
+            return parsed_json, should_retry
+        
+        # If no code blocks found, try parsing the text directly (unless that already failed above)
+        if direct_error:
+            raise direct_error
+        parsed_json = _json_loads(text)
         should_retry = parsed_json.get('success') is False
         return parsed_json, should_retry
-    except json.JSONDecodeError:
+        
+    except (json.JSONDecodeError, AttributeError) as e:
+        logger.warning("Failed to parse JSON from text: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Text content: %s...", text[:500])  # First 500 chars for debugging
+        return None, True # Retry if not able to decode JSON
+
+def decode_topic_validation(text):
+    """Decode and validate the topic checker's JSON output in one msgspec pass
+    
+    Returns:
+        dict: The validation result, or None if msgspec is unavailable or the text
+        isn't bare JSON matching the schema (callers then fall back to parse_json_from_markdown)
+    """
+    if msgspec is None:
+        return None
+    try:
+        return msgspec.structs.asdict(msgspec.json.decode(text, type=TopicValidationResult))
+    except msgspec.DecodeError:
+        return None
+
+def non_retryable_error(message):
+    """Build a 489 error response that tells QStash not to retry"""
+    response = jsonify({"error": message})
+    response.headers['Upstash-NonRetryable-Error'] = 'true'
+    return response, 489
+
+def parse_topic_request():
+    """Decode and validate the JSON body shared by /check-topic and /generate-topic
+    
+    Uses a msgspec Struct to decode and type-check the raw body in one pass when
+    msgspec is available, otherwise Flask's request.get_json()
+    
+    Returns:
+        tuple: (data, error_response)
+        - data: dict with stripped topic and user_id plus difficulty and publish_immediately, or None
+        - error_response: the 489 (response, status) to return when the body is invalid, else None
+    """
+    if msgspec:
         try:
-            # If that fails, look for JSON within markdown code blocks
-            import re
-            
-            # Pattern to match ```json\n...content...\n```
-            json_pattern = r'```json\s*\n(.*?)\n```'
-            match = re.search(json_pattern, text, re.DOTALL)
-            
-            if match:
-                json_content = match.group(1)
-                parsed_json = json.loads(json_content)
-                should_retry = parsed_json.get('success') is False
-                return parsed_json, should_retry
-            
-            # Pattern to match ```\n...content...\n``` (without json specifier)
-            generic_pattern = r'```\s*\n(.*?)\n```'
-            match = re.search(generic_pattern, text, re.DOTALL)
-            
-            if match:
-                json_content = match.group(1)
-                parsed_json = json.loads(json_content)
-                should_retry = parsed_json.get('success') is False
-                return parsed_json, should_retry
-            
-            # If no code blocks found, try parsing the text directly
-            parsed_json = json.loads(text)
-            should_retry = parsed_json.get('success') is False
-            return parsed_json, should_retry
-            
-        except (json.JSONDecodeError, AttributeError) as e:
-            print(f"Failed to parse JSON from text: {e}", flush=True)
-            print(f"Text content: {text[:500]}...", flush=True)  # Print first 500 chars for debugging
-            return None, True # Retry if not able to decode JSON
+            data = msgspec.structs.asdict(msgspec.json.decode(request.get_data(), type=TopicRequest))
+        except msgspec.ValidationError as e:
+            return None, non_retryable_error(f"Invalid request: {e}")
+        except msgspec.DecodeError:
+            return None, non_retryable_error("No JSON data provided")
+    else:
+        data = request.get_json()
+        if not data:
+            return None, non_retryable_error("No JSON data provided")
+    
+    topic = data.get('topic')
+    user_id = data.get('user_id')
+    if not topic:
+        return None, non_retryable_error("Topic is required")
+    if not user_id:
+        return None, non_retryable_error("User ID is required")
+    
+    return {
+        "topic": topic.strip(),
+        "user_id": user_id.strip(),
+        "difficulty": data.get('difficulty', 'Beginner'),
+        "publish_immediately": data.get('publish_immediately', 'True')
+    }, None
 
 @app.route('/ok')
 def ok():
-    print("Hitting health service...", flush=True)
+    logger.debug("Hitting health service...")
 
     return 'Topic Generator API is running!'
 
@@ -136,71 +380,100 @@ def ok():
 def check_topic():
     """Check if a topic is valid"""
     try:
-        print("Hitting check topic service...", flush=True)
+        logger.debug("Hitting check topic service...")
         
-        data = request.get_json()
-        if not data:
-            response = jsonify({"error": "No JSON data provided"})
-            response.headers['Upstash-NonRetryable-Error'] = 'true'
-            return response, 489
-        
-        topic = data.get('topic')
-        user_id = data.get('user_id')
-        
-        if not topic:
-            response = jsonify({"error": "Topic is required"})
-            response.headers['Upstash-NonRetryable-Error'] = 'true'
-            return response, 489
-        if not user_id:
-            response = jsonify({"error": "User ID is required"})
-            response.headers['Upstash-NonRetryable-Error'] = 'true'
-            return response, 489
+        data, error_response = parse_topic_request()
+        if error_response:
+            return error_response
         
-        topic = topic.strip()
-        user_id = user_id.strip()
+        topic = data['topic']
+        user_id = data['user_id']
         
-        print(f"Checking topic validity for '{topic}' from user {user_id}", flush=True)
+        logger.info("Checking topic validity for '%s' from user %s", topic, user_id)
         validation_result, status_code = check_topic_validity(topic, user_id)
         
         return jsonify(validation_result), status_code
             
     except Exception as e:
-        print(f"Error in check_topic: {str(e)}", flush=True)
+        logger.error("Error in check_topic: %s", e)
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+# Recently validated topics, so QStash retries and repeat requests skip a full checker run.
+# Only VALID results are cached: INVALID ones also notify the user, which must happen every time.
+_VALID_TOPIC_CACHE_TTL_SECONDS = 600
+_VALID_TOPIC_CACHE_MAXSIZE = 4096
+_valid_topic_cache = OrderedDict()
+_valid_topic_cache_lock = threading.Lock()
+
+def _validation_cache_key(topic):
+    """Normalize a topic for the validation cache: case-insensitive, with whitespace runs collapsed"""
+    return " ".join(topic.split()).casefold()
+
+def _get_cached_validation(topic):
+    """Return the cached validation result for a topic, or None if missing or expired"""
+    key = _validation_cache_key(topic)
+    with _valid_topic_cache_lock:
+        entry = _valid_topic_cache.get(key)
+        if entry is None:
+            return None
+        cached_at, result = entry
+        if time.monotonic() - cached_at >= _VALID_TOPIC_CACHE_TTL_SECONDS:
+            del _valid_topic_cache[key]
+            return None
+        _valid_topic_cache.move_to_end(key)
+        return dict(result)
+
+def _cache_validation(topic, result):
+    """Remember a VALID result for a topic, evicting the least recently used entry when full"""
+    key = _validation_cache_key(topic)
+    with _valid_topic_cache_lock:
+        _valid_topic_cache[key] = (time.monotonic(), dict(result))
+        _valid_topic_cache.move_to_end(key)
+        if len(_valid_topic_cache) > _VALID_TOPIC_CACHE_MAXSIZE:
+            _valid_topic_cache.popitem(last=False)
+
 def check_topic_validity(topic, user_id):
     """Internal function to check if a topic is valid"""
     try:
-        print(f"Checking topic validity: {topic} from user {user_id}", flush=True)
+        logger.debug("Checking topic validity: %s from user %s", topic, user_id)
+        
+        cached = _get_cached_validation(topic)
+        if cached:
+            logger.info("Using cached validation for '%s'", topic)
+            return cached, 200
         
-        # Get current timestamp and set session
-        timestamp = int(time.time())
-        session_id = f"session_{user_id}_{timestamp}"
+        # Set a unique session for this request
+        session_id = new_session_id(user_id)
         
         # Step 1: Create session
-        create_response = create_session(TOPIC_CHECKER_BASE_URL, user_id, session_id)
+        create_response = create_session(TOPIC_CHECKER_BASE_URL, "topic-checker", user_id, session_id)
         if create_response.status_code != 200:
             return {"error": "Failed to create session"}, 500
         
         # Step 2: Run topic checker
-        message_text = json.dumps({"topic": topic, "user_id": user_id})
+        message_text = _json_dumps({"topic": topic, "user_id": user_id})
         run_response = run_service(TOPIC_CHECKER_BASE_URL, "topic-checker", user_id, session_id, message_text)
         
         if run_response.status_code != 200:
+            delete_session_async(TOPIC_CHECKER_BASE_URL, "topic-checker", user_id, session_id)
             return {"error": "Failed to check topic"}, 500
         
         # Step 3: Extract response
-        response_data = run_response.json()
-        model_response = extract_model_response(response_data)
+        model_response = extract_model_text(run_response.content)
         
-        # Step 4: Delete session
-        delete_session(TOPIC_CHECKER_BASE_URL, "topic-checker", user_id, session_id)
+        # Step 4: Delete session (in the background; the result doesn't depend on it)
+        delete_session_async(TOPIC_CHECKER_BASE_URL, "topic-checker", user_id, session_id)
         
         if model_response:
-            # Parse the JSON response from the model (handles markdown code blocks)
-            parsed_response, should_retry = parse_json_from_markdown(model_response)
-            if parsed_response:
-                return parsed_response, 200
+            # The checker's output schema means it normally replies with bare JSON
+            validation = decode_topic_validation(model_response)
+            if not validation:
+                # Parse the JSON response from the model (handles markdown code blocks)
+                validation, should_retry = parse_json_from_markdown(model_response)
+            if validation:
+                if validation.get('status') == 'VALID':
+                    _cache_validation(topic, validation)
+                return validation, 200
             else:
                 return {"error": "Invalid JSON response from model"}, 500
         else:
@@ -213,41 +486,34 @@ def check_topic_validity(topic, user_id):
 def generate_topic():
     """Check topic validity and generate content if valid"""
     try:
-        print("Hitting generate topic service...", flush=True)
+        logger.debug("Hitting generate topic service...")
 
-        data = request.get_json()
-        if not data:
-            response = jsonify({"error": "No JSON data provided"})
-            response.headers['Upstash-NonRetryable-Error'] = 'true'
-            return response, 489
+        data, error_response = parse_topic_request()
+        if error_response:
+            return error_response
         
-        topic = data.get('topic')
-        difficulty = data.get('difficulty', 'Beginner')
-        user_id = data.get('user_id')
-        publish_immediately = data.get('publish_immediately', 'True')
+        topic = data['topic']
+        difficulty = data['difficulty']
+        user_id = data['user_id']
+        publish_immediately = data['publish_immediately']
         
-        if not topic:
-            response = jsonify({"error": "Topic is required"})
-            response.headers['Upstash-NonRetryable-Error'] = 'true'
-            return response, 489
-        if not user_id:
-            response = jsonify({"error": "User ID is required"})
-            response.headers['Upstash-NonRetryable-Error'] = 'true'
-            return response, 489
-        
-        topic = topic.strip()
-        user_id = user_id.strip()
+        # Create the topic generator session while the topic is being checked;
+        # it is deleted again if generation doesn't go ahead
+        session_id = new_session_id(user_id)
+        create_future = _session_executor.submit(create_session, TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id)
         
         # Step 1: Check topic validity first
-        print(f"Step 1: Checking topic validity for '{topic}' from user {user_id}", flush=True)
+        logger.info("Step 1: Checking topic validity for '%s' from user %s", topic, user_id)
         validation_result, status_code = check_topic_validity(topic, user_id)
         
         if status_code != 200:
+            discard_session_when_created(create_future, TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id)
             return jsonify(validation_result), status_code
         
         # Check if topic is invalid
         if validation_result.get('status') == 'INVALID':
-            print(f"Topic '{topic}' is invalid: {validation_result.get('reason')}", flush=True)
+            discard_session_when_created(create_future, TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id)
+            logger.info("Topic '%s' is invalid: %s", topic, validation_result.get('reason'))
             response = jsonify({
                 "error": "Topic is invalid",
                 "validation": validation_result
@@ -255,47 +521,45 @@ def generate_topic():
             response.headers['Upstash-NonRetryable-Error'] = 'true'
             return response, 489
         
-        print(f"Topic '{topic}' is valid. Proceeding with generation...", flush=True)
+        logger.info("Topic '%s' is valid. Proceeding with generation...", topic)
         
         # Step 2: Generate content for valid topic
-        # Get current timestamp and set session
-        timestamp = int(time.time())
-        session_id = f"session_{user_id}_{timestamp}"
-        
-        # Create session for topic generator
-        create_response = create_session(TOPIC_GENERATOR_BASE_URL, user_id, session_id)
+        # Wait for the topic generator session started above
+        create_response = create_future.result()
         if create_response.status_code != 200:
             return jsonify({"error": "Failed to create session for topic generation"}), 500
         
-        # Run topic generator
-        message_text = json.dumps({
+        # Run topic generator. QStash keeps the message ID across retries, so the
+        # agent uses it to skip re-inserting a topic an earlier attempt already saved
+        message_text = _json_dumps({
             "topic": topic,
             "difficulty": difficulty,
             "user_id": user_id,
-            "publish_immediately": publish_immediately
+            "publish_immediately": publish_immediately,
+            "request_id": request.headers.get('Upstash-Message-Id')
         })
         run_response = run_service(TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id, message_text)
         
         # TODO: Sometimes even if topic is generated, it is still returning a non 200 response, which is resulting in double generation due to retry. Make the flow more robust by using a newly created table called topic_generation_requests and using that as an alternative source of truth. Maybe use the qstash_message_id in that table to keep track of whether it is in progress, error or success.
         if run_response.status_code != 200:
+            delete_session_async(TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id)
             return jsonify({"error": f"Failed to generate topic content. Response: {str(run_response)}"}), 500
         
         # Extract response
-        response_data = run_response.json()
-        model_response = extract_model_response(response_data)
+        model_response = extract_model_text(run_response.content)
         
-        # Delete session
-        delete_session(TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id)
+        # Delete session (in the background; the result doesn't depend on it)
+        delete_session_async(TOPIC_GENERATOR_BASE_URL, "topic-generator", user_id, session_id)
         
         if model_response:
             # Parse the JSON response from the model (handles markdown code blocks)
             parsed_response, should_retry = parse_json_from_markdown(model_response)
             if parsed_response:
                 if should_retry:
-                    print(f"Topic generation failed for '{topic}': {parsed_response.get('message', 'Error occurred while generating topic')}", flush=True)
+                    logger.warning("Topic generation failed for '%s': %s", topic, parsed_response.get('message', 'Error occurred while generating topic'))
                     return jsonify(parsed_response), 500  # Return 500 to trigger QStash retry
                 else:
-                    print(f"Successfully generated content for topic '{topic}'", flush=True)
+                    logger.info("Successfully generated content for topic '%s'", topic)
                     return jsonify(parsed_response), 200
             else:
                 return jsonify({"error": "Invalid JSON response from model"}), 500
@@ -303,8 +567,9 @@ def generate_topic():
             return jsonify({"error": "No valid response from topic generator"}), 500
             
     except Exception as e:
-        print(f"Error in generate_topic: {str(e)}", flush=True)
+        logger.error("Error in generate_topic: %s", e)
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 if __name__ == '__main__':
+    # Local development only; production runs under gunicorn (see gunicorn.conf.py)
     app.run(host='0.0.0.0', port=10000, debug=True)
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for the generator API (picked up automatically when gunicorn
+is started from this directory, e.g. `gunicorn app:app`)
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+
+# Requests spend nearly all their time waiting on the ADK servers, so threads
+# (not extra processes) provide most of the concurrency
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+
+# Import app.py once in the arbiter and fork workers from it. Safe because nothing
+# at import time opens connections or starts threads: the HTTP pool and the
+# session executor are only populated on first use inside a worker
+preload_app = True
+
+# gthread workers keep heartbeating while a request is in flight, so long
+# topic generations aren't killed by this timeout
+timeout = 120
+keepalive = 30